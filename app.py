@@ -54,6 +54,7 @@ def protected_layout():
         config,
         dash.page_container,
         dcc.Store(id='config-store', storage_type="session", data={"trigger": True}),
+        dcc.Store(id='budget-version'),
         dcc.Store(id='transaction-data-store'),
         dcc.Store(id='transaction-subset-store'),
         dcc.Store(id='monarch-session-store', storage_type="session")
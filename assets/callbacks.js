@@ -0,0 +1,168 @@
+// Clientside callbacks for interactions that only need light arithmetic.
+// Most mirror the server callback they replaced.
+
+// Parse an ISO date or datetime ("YYYY-MM-DD[THH:MM:SS]") as UTC
+function parseDate(value) {
+    const [datePart, timePart = "00:00:00"] = value.split("T");
+    const [year, month, day] = datePart.split("-").map(Number);
+    const [hours = 0, minutes = 0, seconds = 0] = timePart.split(":").map(Number);
+    return new Date(Date.UTC(year, month - 1, day, hours, minutes, seconds));
+}
+
+// Format like Python's datetime.isoformat()
+function formatDate(date) {
+    return date.toISOString().slice(0, 19);
+}
+
+// Shift by whole months, clamping to the end of the month like relativedelta
+function addMonths(date, months) {
+    const target = new Date(Date.UTC(date.getUTCFullYear(), date.getUTCMonth() + months, 1,
+        date.getUTCHours(), date.getUTCMinutes(), date.getUTCSeconds()));
+    const lastDay = new Date(Date.UTC(target.getUTCFullYear(), target.getUTCMonth() + 1, 0)).getUTCDate();
+    target.setUTCDate(Math.min(date.getUTCDate(), lastDay));
+    return target;
+}
+
+function lastDayOfMonth(date) {
+    const next = addMonths(date, 1);
+    next.setUTCDate(1);
+    next.setUTCDate(0);
+    return next;
+}
+
+function sameMonth(a, b) {
+    return a.getUTCFullYear() === b.getUTCFullYear() && a.getUTCMonth() === b.getUTCMonth();
+}
+
+// Numeric value of a cell, or null when missing or not a number
+function cellValue(value) {
+    if (value === null || value === undefined || value === "") {
+        return null;
+    }
+    const number = Number(value);
+    return Number.isNaN(number) ? null : number;
+}
+
+// Round to cents so running totals don't drift
+function roundCents(value) {
+    return Math.round(value * 100) / 100;
+}
+
+function sumValues(totals) {
+    return Object.values(totals).reduce((a, b) => a + b, 0);
+}
+
+function formatMoney(value) {
+    return value.toLocaleString("en-US", {minimumFractionDigits: 2, maximumFractionDigits: 2});
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    budgetbaby: {
+        // Step the date picker back or forward a month (single month
+        // selected) or a year, clamped to the allowed range
+        adjust_date_range: function (backClicks, forwardClicks, startDate, endDate,
+                                     minDateAllowed, maxDateAllowed) {
+            const trigger = dash_clientside.callback_context.triggered_id;
+            if (!trigger) {
+                throw dash_clientside.PreventUpdate;
+            }
+
+            const start = parseDate(startDate);
+            const end = parseDate(endDate);
+            const minDate = minDateAllowed ? parseDate(minDateAllowed) : null;
+            const maxDate = maxDateAllowed ? parseDate(maxDateAllowed) : null;
+
+            const months = sameMonth(start, end) ? 1 : 12;
+
+            let newStart;
+            let newEnd;
+            if (trigger === "back-year") {
+                if (minDate && start <= minDate) {
+                    throw dash_clientside.PreventUpdate;
+                }
+                newStart = addMonths(start, -months);
+                newEnd = addMonths(end, -months);
+            } else if (trigger === "forward-year") {
+                if (maxDate && end >= maxDate) {
+                    throw dash_clientside.PreventUpdate;
+                }
+                newStart = addMonths(start, months);
+                newEnd = addMonths(end, months);
+            } else {
+                throw dash_clientside.PreventUpdate;
+            }
+
+            if (sameMonth(newStart, newEnd)) {
+                newEnd = lastDayOfMonth(newEnd);
+            }
+
+            if (minDate) {
+                newStart = new Date(Math.max(newStart, minDate));
+                newEnd = new Date(Math.max(newEnd, minDate));
+            }
+            if (maxDate) {
+                newStart = new Date(Math.min(newStart, maxDate));
+                newEnd = new Date(Math.min(newEnd, maxDate));
+            }
+
+            return [formatDate(newStart), formatDate(newEnd)];
+        },
+
+        // Drop cached blocks of the drill-down grid and scroll to the top
+        refresh_drilldown: function (query) {
+            const api = dash_ag_grid.getApi("transaction-grid");
+            if (api) {
+                api.purgeInfiniteCache();
+            }
+            return {rowIndex: 0};
+        },
+
+        // Apply the edits of a change session to the running month totals
+        // (income rows vs all other rows), one cell at a time
+        apply_budget_edits: function (changes, totals) {
+            if (!changes || !totals) {
+                throw dash_clientside.PreventUpdate;
+            }
+            const patch = new dash_clientside.Patch();
+            const updated = {income: {...totals.income}, spending: {...totals.spending}};
+            changes.forEach(change => {
+                const bucket = change.data.csp_label === "income" ? "income" : "spending";
+                if (!(change.colId in updated[bucket])) {
+                    return;
+                }
+                const delta = (cellValue(change.value) || 0) - (cellValue(change.oldValue) || 0);
+                updated[bucket][change.colId] = roundCents(updated[bucket][change.colId] + delta);
+                patch.assign([bucket, change.colId], updated[bucket][change.colId]);
+            });
+            return patch.build();
+        },
+
+        // Pin a total spending row (all non-income rows) under the budget grid
+        pin_total_row: function (totals) {
+            if (!totals) {
+                throw dash_clientside.PreventUpdate;
+            }
+            return new dash_clientside.Patch()
+                .assign(["pinnedBottomRowData"], [{category: "Total", ...totals.spending}])
+                .build();
+        },
+
+        // Show how much income is left to budget, or how far over budget
+        update_total_button: function (totals) {
+            if (!totals) {
+                throw dash_clientside.PreventUpdate;
+            }
+            const totalRemaining = sumValues(totals.income) - sumValues(totals.spending);
+
+            if (totalRemaining > 0.12) {
+                return [`$${formatMoney(totalRemaining)} Remaining! Click to assign to Guilt-Free spending.`,
+                        "primary", false];
+            }
+            if (totalRemaining < -0.12) {
+                return [`$${formatMoney(-totalRemaining)} Over Budget! Click to subtract from Guilt-Free spending.`,
+                        "danger", false];
+            }
+            return ["Well Done! Every penny has a job.", "light", true];
+        },
+    },
+});
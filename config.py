@@ -2,19 +2,17 @@ import dash
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 from dash import html, dcc, callback, Input, Output, State
-import json
 from monarchmoney import MonarchMoney, RequireMFAException
 import asyncio
-import pandas as pd
 from datetime import datetime as dt
-from io import StringIO
 import uuid
 import pickle
 import base64
 from flask import session
 
-from firebase import db
-from lib.utils import functions
+from firebase import store
+from lib.utils import monarch, settings, sync, writer
+from lib.utils.store import progress_path
 
 
 def pickle_and_encode(obj):
@@ -117,12 +115,17 @@ transaction_modal = dbc.Modal(
     [
         dbc.ModalHeader("Fetch Updated Transactions"),
         dbc.ModalBody(
-            [html.P("Select a range of dates to fetch updated transactions."),
-            transaction_form]
+            [html.P("Sync changes since the last refresh, or select a range of dates to fetch updated transactions."),
+            transaction_form,
+            html.Div(id="fetch-progress", style={"marginTop": "10px", "color": "bg-secondary"}),
+            html.Div(id="fetch-status", style={"marginTop": "10px", "color": "bg-secondary"}),
+            # Polls the fetch progress while a sync or fetch runs
+            dcc.Interval(id="fetch-progress-interval", interval=1000, disabled=True)]
         ),
         dbc.ModalFooter(
             [
-                dbc.Button("Fetch", id="fetch-button", color="primary"),
+                dbc.Button("Sync", id="sync-button", color="primary"),
+                dbc.Button("Fetch", id="fetch-button", color="primary", outline=True),
                 dbc.Button("Close", id="close-transaction-modal-button", color="secondary"),
             ]
         ),
@@ -167,104 +170,22 @@ config = html.Div(
 )
 def store_config(dummy):
     """
-    Store combined user and household config in browser memory.
+    Store the version of the combined user and household config.
+
+    The config is assembled with batched, concurrent reads and kept
+    server-side under its version (see ``settings.load_config``);
+    callbacks read projections of it through ``settings``.
 
     Returns
     -------
     str
-        JSON-serialized config object with structure like local config.json
+        Config version
     """
     uid = session.get("user_id")
     if not uid:
         raise ValueError("Error: User not found")
 
-    # Find the household where the user is a member
-    matching = (
-        db.collection("households")
-          .where("members", "array_contains", uid)
-          .limit(1)
-          .stream()
-    )
-    household_doc = next(matching, None)
-    if household_doc is None:
-        raise ValueError("Error: User not assigned to a household")
-    
-    household_data = household_doc.to_dict()
-    household_id = household_doc.id
-    members = household_data.get("members", [])
-
-    # Helper to fetch budgets
-    def fetch_budgets(ref):
-        budgets = {}
-        budget_docs = ref.collection("budgets").stream()
-        for doc in budget_docs:
-            year, month = doc.id.split("-")
-            year_dict = budgets.setdefault(year, {})
-            year_dict[int(month)] = doc.to_dict()
-        return budgets
-
-    config = {
-        "users": {},
-        "group_names": {},
-        "cat_names": {},
-        "account_owner": {}  # <-- Add account_owner mapping!
-    }
-
-    # Household (joint) budgets and settings
-    household_budgets = fetch_budgets(db.collection("households").document(household_id))
-    config["users"]["joint"] = {
-        "uid": "joint",
-        "budget": household_budgets,
-        "drop_cats": household_data.get("drop_cats", []),
-        "csp_from_group": household_data.get("csp_from_group", {}),
-        "csp_from_category": household_data.get("csp_from_category", {}),
-        "csp_labels": household_data.get("csp_labels", {}),
-        "cat_order": household_data.get("cat_order", []),
-        "group_names": household_data.get("group_names", {}),
-        "cat_names": household_data.get("cat_names", {}),
-        "accounts": household_data.get("accounts", [])
-    }
-
-    # Household accounts → owner is 'joint'
-    for acct in household_data.get("accounts", []):
-        config["account_owner"][acct] = "joint"
-
-    # Individual budgets and settings
-    for member_id in members:
-        user_ref = db.collection("users").document(member_id)
-        user_doc = user_ref.get()
-        if not user_doc.exists:
-            continue
-
-        user_data = user_doc.to_dict()
-        username = user_data.get("name", member_id)
-
-        # Save group_names and cat_names once
-        if not config["group_names"]:
-            config["group_names"] = user_data.get("group_names", {})
-        if not config["cat_names"]:
-            config["cat_names"] = user_data.get("cat_names", {})
-
-        user_budgets = fetch_budgets(user_ref)
-
-        config["users"][username] = {
-            "uid": member_id,
-            "budget": user_budgets,
-            "drop_cats": user_data.get("drop_cats", []),
-            "csp_from_group": user_data.get("csp_from_group", {}),
-            "csp_from_category": user_data.get("csp_from_category", {}),
-            "csp_labels": user_data.get("csp_labels", {}),
-            "cat_order": user_data.get("cat_order", []),
-            "group_names": user_data.get("group_names", {}),
-            "cat_names": user_data.get("cat_names", {}),
-            "accounts": user_data.get("accounts", [])
-        }
-
-        # User accounts → owner is username
-        for acct in user_data.get("accounts", []):
-            config["account_owner"][acct] = username
-
-    return json.dumps(config)
+    return settings.load_config(store, uid)
 
 
 
@@ -274,25 +195,24 @@ def store_config(dummy):
     Input('config-store', 'data'),
     prevent_initial_call=True
 )
-def populate_use_case_dropdown(config):
+def populate_use_case_dropdown(config_version):
     """
     Populate the use-case dropdown from config.
 
     Parameters
     ----------
-    config : str
-        JSON string of config from `config-store`.
+    config_version : str
+        Config version from `config-store`.
 
     Returns
     -------
     list[dict], str
         Dropdown options, default value
     """
-    if not config:
+    if not config_version:
         raise dash.exceptions.PreventUpdate
 
-    config = json.loads(config)
-    user_keys = list(config.get("users", {}).keys())
+    user_keys = settings.users(store, session.get("user_id"), config_version)
 
     # Create options for each user + add 'joint'
     options = [{'label': user.title(), 'value': user} for user in user_keys]
@@ -305,13 +225,15 @@ def populate_use_case_dropdown(config):
     [Output("login-modal", "is_open"), 
      Output("transaction-modal", "is_open"),
      Output("login-status", "children"),
+     Output("fetch-status", "children"),
      Output('transaction-data-store', 'data', allow_duplicate=True),
      Output('monarch-session-store', 'data')],
     [Input("open-modal-button", "n_clicks"),
      Input("close-login-modal-button", "n_clicks"),
      Input("close-transaction-modal-button", "n_clicks"),
      Input("login-button", "n_clicks"),
-     Input("fetch-button", "n_clicks")],
+     Input("fetch-button", "n_clicks"),
+     Input("sync-button", "n_clicks")],
     [State("username-input", "value"), 
      State("password-input", "value"),
      State("transaction-date-picker", "start_date"),
@@ -319,12 +241,15 @@ def populate_use_case_dropdown(config):
      State('transaction-data-store', 'data'),
      State('monarch-session-store', 'data'),
      State('config-store', 'data')],
+    running=[(Output("fetch-progress-interval", "disabled"), False, True),
+             (Output("sync-button", "disabled"), True, False),
+             (Output("fetch-button", "disabled"), True, False)],
     prevent_initial_call=True,
 )
 def manage_and_handle_modals(
     open_clicks, close_login_clicks, close_transaction_clicks, 
-    login_clicks, fetch_clicks, username, password, start_date, end_date, 
-    stored_transaction_data, session_data, config_json
+    login_clicks, fetch_clicks, sync_clicks, username, password, start_date, end_date, 
+    stored_transaction_data, session_data, config_version
 ):
     """
     Manages modal states and functionality.
@@ -334,23 +259,29 @@ def manage_and_handle_modals(
     If not, the login modal is shown. Successful login
     triggers the transactions modal.
 
-    User selects a date range and fetches transactions. Existing
-    transactions are updated by truncating existing transactions in the
-    date range selected and appending fetched transactions. Raw 
-    transaction data are stored in transaction-data-store.
+    Sync refreshes the months since the household's last sync plus a few
+    older months from a rotating sweep (see ``monarch.sync_transactions``).
+    Alternatively, the user selects a date range and fetches
+    transactions. The range is downloaded month by month and each month
+    replaces the stored transactions for that month as soon as it
+    arrives. Only changed transactions are written; writes are
+    committed in concurrent batches. Progress and throughput are
+    published to the user's progress document while the writes run (see
+    ``update_fetch_progress``) and summarized once they finish. The refreshed transactions are cached
+    server-side and a handle to them is stored in transaction-data-store.
     """
     ctx = dash.callback_context
 
     if not ctx.triggered:
-        return False, False, "", stored_transaction_data, session_data
+        return False, False, "", "", stored_transaction_data, session_data
 
     triggered_id = ctx.triggered[0]["prop_id"].split(".")[0]
 
     # Close the modal
     if triggered_id == "close-login-modal-button":
-        return False, False, "", stored_transaction_data, session_data
+        return False, False, "", "", stored_transaction_data, session_data
     if triggered_id == "close-transaction-modal-button":
-        return False, False, "", stored_transaction_data, session_data
+        return False, False, "", "", stored_transaction_data, session_data
     
     # Check for existing session and open appropriate modal
     if triggered_id == "open-modal-button":
@@ -359,18 +290,18 @@ def manage_and_handle_modals(
             try:
                 # Validate session is still active
                 asyncio.run(mm.get_accounts())
-                return False, True, "", stored_transaction_data, session_data
+                return False, True, "", "", stored_transaction_data, session_data
             except:
                 # Session expired, need to login again
-                return True, False, "", stored_transaction_data, None
+                return True, False, "", "", stored_transaction_data, None
         else:
             # No session exists, open the login modal
-            return True, False, "", stored_transaction_data, None
+            return True, False, "", "", stored_transaction_data, None
 
     # No saved session: login with username and password from login modal
     if triggered_id == "login-button":
         if not username or not password:
-            return True, False, "Please enter both username and password.", stored_transaction_data, None
+            return True, False, "Please enter both username and password.", "", stored_transaction_data, None
         
         async def login_to_monarch(email, password):
             mm = MonarchMoney()
@@ -381,55 +312,78 @@ def manage_and_handle_modals(
                                use_saved_session=False, save_session=False)
                 # Pickle and store session data
                 print("LOGIN SUCCESSFUL")
-                return False, True, "", stored_transaction_data, pickle_and_encode(mm)
+                return False, True, "", "", stored_transaction_data, pickle_and_encode(mm)
             except Exception as e:
                 print(f"Login failed: {str(e)}")
-                return True, False, f"Login failed: {str(e)}", stored_transaction_data, None
+                return True, False, f"Login failed: {str(e)}", "", stored_transaction_data, None
 
         return asyncio.run(login_to_monarch(username, password))
     
-    # Handle the fetch button
-    if triggered_id == "fetch-button":
-        async def fetch_transactions(mm, start_date, end_date):
-            # Await the get_transactions call
-            transactions = await mm.get_transactions(start_date=start_date, end_date=end_date, limit=None)
-            
-            # Convert to dataframe
-            transactions = pd.DataFrame(transactions['allTransactions']['results'])
-            transactions['date'] = pd.to_datetime(transactions['date'], utc=True)
-
-            print(f'{len(transactions)} new transactions fetched from {transactions['date'].min()} to\
-                  {transactions['date'].max()}')
-
-            # Return results
-            return transactions
-
+    # Handle the sync and fetch buttons
+    if triggered_id in ("sync-button", "fetch-button"):
         try:
             if not session_data:
                 raise Exception("No valid session found")
 
-            # Fetch transactions for selected dates
             mm = decode_and_unpickle(session_data)      
-            new_transactions = asyncio.run(fetch_transactions(mm, start_date, end_date))
+            uid = session.get("user_id")
+            existing_transactions = sync.resolve_transactions(store, uid, stored_transaction_data)
+            config_json = settings.get_config_json(store, uid, config_version)
 
-            # Update existing transactions with new transactions
-            existing_transactions = pd.read_json(StringIO(stored_transaction_data), orient='split')
-            start_date = dt.fromisoformat(start_date)
-            end_date = dt.fromisoformat(end_date)
+            # Publish progress for update_fetch_progress to poll
+            store.update_document(progress_path(uid), {"message": "Fetching transactions..."})
+            progress = writer.store_progress(store, progress_path(uid))
 
-            # Update transactions and store in transaction-data-store
-            transactions = functions.update_transactions(
-                db, existing_transactions, new_transactions, 
-                start_date, end_date, config_json)
-            
-            print(transactions.iloc[0])
-            
-            transactions_json = transactions.to_json(date_format='iso', orient='split')
-            return False, False, "", transactions_json, session_data
+            try:
+                if triggered_id == "sync-button":
+                    # Refresh from the household's watermark
+                    stats = asyncio.run(monarch.sync_transactions(
+                        mm, store, existing_transactions, config_json, uid, progress=progress))
+                else:
+                    start_date = dt.fromisoformat(start_date)
+                    end_date = dt.fromisoformat(end_date)
+
+                    # Fetch month by month, writing each month as it arrives
+                    stats = asyncio.run(monarch.fetch_and_update(
+                        mm, store, existing_transactions, start_date, end_date,
+                        config_json, uid, progress=progress))
+            finally:
+                store.update_document(progress_path(uid), {"message": None})
+            print(f"{stats['fetched']} transactions fetched")
+
+            # Pick up the writes incrementally and publish the new version
+            transactions_handle = sync.load_transactions(store, uid)
+            return False, True, "", writer.format_summary(stats), transactions_handle, session_data
         
         except Exception as e:
             print(f"Failed to fetch transactions: {str(e)}")
-            return False, True, "", stored_transaction_data, session_data
+            return False, True, "", f"Failed to fetch transactions: {str(e)}", stored_transaction_data, session_data
 
     # # Default: Both modals closed
-    # return False, False, "", stored_transaction_data, session_data
+    # return False, False, "", "", stored_transaction_data, session_data
+
+
+@callback(
+    Output("fetch-progress", "children"),
+    Input("fetch-progress-interval", "n_intervals"),
+    prevent_initial_call=True,
+)
+def update_fetch_progress(n_intervals):
+    """
+    Show the progress of a running sync or fetch.
+
+    ``manage_and_handle_modals`` enables the interval while it runs and
+    publishes progress to the user's progress document, which is read
+    here (any worker can serve the poll).
+
+    Returns
+    -------
+    str
+        Latest progress message, or "" once the fetch has finished.
+    """
+    uid = session.get("user_id")
+    if not uid:
+        raise dash.exceptions.PreventUpdate
+
+    status = store.get_document(progress_path(uid)) or {}
+    return status.get("message") or ""
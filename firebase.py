@@ -1,7 +1,9 @@
 import os
 import json
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials
+
+from lib.utils.store import DEFAULT_STORE, open_store
 
 # Prevent multiple initializations
 if not firebase_admin._apps:
@@ -30,4 +32,14 @@ if not firebase_admin._apps:
         except Exception as e:
             raise ValueError(f"Error loading Firebase credentials from file: {e}")
 
-db = firestore.client()
\ No newline at end of file
+# Persistence for transactions, budgets and settings. Set
+# TRANSACTION_STORE=sqlite to run against a local file instead; the
+# Firestore client is only created for the Firestore backend.
+STORE_KIND = os.environ.get("TRANSACTION_STORE", DEFAULT_STORE)
+if STORE_KIND == "firestore":
+    from firebase_admin import firestore
+    db = firestore.client()
+else:
+    db = None
+
+store = open_store(STORE_KIND, db=db)
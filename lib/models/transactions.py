@@ -13,13 +13,21 @@ class Transactions:
 
     def _get_transactions(self):
         if self._transactions is None:
-            raw_transactions = pd.read_pickle('../data/raw-transactions.pkl')
+            raw_transactions = functions.normalize_transactions(
+                pd.read_pickle('../data/raw-transactions.pkl')
+                )
             with open('../data/config.json', 'r') as f:
                 config = json.load(f)
+
+            # Category names are shared; mappings are per user
+            user_config = {"cat_names": config["cat_names"], **config["users"][self.name]}
+            accounts = [acct for acct, owner in config.get("account_owner", {}).items()
+                        if owner == self.name]
+            filt = raw_transactions["account_name"].isin(accounts)
         
             # Read transactions
             self._transactions = functions.process_transactions(
-                raw_transactions, config, self.name
+                raw_transactions.loc[filt], user_config
                 )
 
         return self._transactions
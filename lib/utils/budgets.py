@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+
+def _month_number(year, month):
+    return int(year) * 12 + int(month) - 1
+
+
+class BudgetMatrix:
+    """
+    Monthly budgets of one user as a categories by months array.
+
+    Months run contiguously from the first to the last budgeted month;
+    months without a budget document are NaN and flagged absent. Row
+    prefix sums (NaN counted as 0) make any period total two lookups per
+    category.
+
+    Parameters
+    ----------
+    categories : list[str]
+        Row labels.
+    first_month : int
+        ``year * 12 + month - 1`` of the first column.
+    values : np.ndarray
+        Budgets, categories by months.
+    present : np.ndarray
+        Whether each month has a budget document.
+    """
+
+    def __init__(self, categories, first_month, values, present):
+        self.categories = pd.Index(categories)
+        self.first_month = first_month
+        self.values = values
+        self.present = present
+        self.cumulative = np.zeros((len(categories), values.shape[1] + 1))
+        np.cumsum(np.nan_to_num(values), axis=1, out=self.cumulative[:, 1:])
+
+    @classmethod
+    def from_config(cls, budget_dict):
+        """
+        Build from ``config['users'][user]['budget']``
+        (``{"YYYY": {month: {category: value}}}``).
+        """
+        months = {
+            _month_number(year, month): values
+            for year, year_months in budget_dict.items()
+            for month, values in year_months.items()
+        }
+        if not months:
+            return cls([], 0, np.zeros((0, 0)), np.zeros(0, dtype=bool))
+
+        # Categories in order of first appearance
+        categories = list(dict.fromkeys(
+            category for month in sorted(months) for category in months[month]
+        ))
+        row = {category: i for i, category in enumerate(categories)}
+
+        first_month = min(months)
+        values = np.full((len(categories), max(months) - first_month + 1), np.nan)
+        present = np.zeros(values.shape[1], dtype=bool)
+        for month, month_values in months.items():
+            column = month - first_month
+            present[column] = True
+            for category, value in month_values.items():
+                values[row[category], column] = np.nan if value is None else value
+        return cls(categories, first_month, values, present)
+
+    def _columns(self, start_year, start_month, end_year, end_month):
+        """Column bounds ``[first, last)`` for an inclusive month range, clamped."""
+        n_months = self.values.shape[1]
+        first = _month_number(start_year, start_month) - self.first_month
+        last = _month_number(end_year, end_month) - self.first_month + 1
+        first = min(max(first, 0), n_months)
+        return first, min(max(last, first), n_months)
+
+    def period_totals(self, start_date, end_date):
+        """
+        Total budget per category for the months from ``start_date`` to
+        ``end_date`` inclusive.
+
+        Returns
+        -------
+        pd.Series
+            Totals indexed by category.
+        """
+        first, last = self._columns(start_date.year, start_date.month,
+                                    end_date.year, end_date.month)
+        totals = self.cumulative[:, last] - self.cumulative[:, first]
+        return pd.Series(totals, index=self.categories)
+
+    def year_frame(self, year):
+        """Budgets for one year, with a column per budgeted month (1-12)."""
+        first, last = self._columns(year, 1, year, 12)
+        columns = [column for column in range(first, last) if self.present[column]]
+        months = [(self.first_month + column) % 12 + 1 for column in columns]
+        return pd.DataFrame(self.values[:, columns], index=self.categories, columns=months)
+
+    def with_changes(self, changes):
+        """
+        Return a matrix with changed cells applied, without rebuilding.
+
+        Falls back to a full rebuild when a change adds a category or a
+        month outside the matrix.
+
+        Parameters
+        ----------
+        changes : dict
+            ``{"YYYY-MM": {category: value}}``, as from ``budget_changes``.
+        """
+        row = {category: i for i, category in enumerate(self.categories)}
+        cells = []
+        for doc_id, values in changes.items():
+            column = _month_number(*doc_id.split("-")) - self.first_month
+            if not 0 <= column < self.values.shape[1] or not self.present[column]:
+                return BudgetMatrix.from_config(self._apply(changes))
+            for category, value in values.items():
+                if category not in row:
+                    return BudgetMatrix.from_config(self._apply(changes))
+                cells.append((row[category], column, value))
+
+        values = self.values.copy()
+        for i, column, value in cells:
+            values[i, column] = value
+        return BudgetMatrix(self.categories, self.first_month, values, self.present)
+
+    def _apply(self, changes):
+        """Nested budget dict of this matrix with changes merged in."""
+        budget_dict = {}
+        for column in np.flatnonzero(self.present):
+            year, month = divmod(self.first_month + column, 12)
+            values = self.values[:, column]
+            budget_dict.setdefault(str(year), {})[str(month + 1)] = {
+                category: value for category, value in zip(self.categories, values)
+                if not np.isnan(value)
+            }
+        for doc_id, values in changes.items():
+            year, month = doc_id.split("-")
+            budget_dict.setdefault(year, {}).setdefault(str(int(month)), {}).update(values)
+        return budget_dict
+
+    def years(self):
+        """Years with at least one budgeted month."""
+        columns = np.flatnonzero(self.present)
+        return sorted({(self.first_month + column) // 12 for column in columns})
+
+
+def budget_changes(matrix, year, frame):
+    """
+    Cells of the budget grid that differ from the stored budgets.
+
+    Parameters
+    ----------
+    matrix : BudgetMatrix
+        Stored budgets the grid was populated from.
+    year : int
+        Year shown in the grid.
+    frame : pd.DataFrame
+        Grid values indexed by category, with a column per month (1-12).
+
+    Returns
+    -------
+    dict
+        ``{"YYYY-MM": {category: value}}`` for changed cells only. Cells
+        cleared in the grid are saved as 0.
+    """
+    values = frame.apply(pd.to_numeric, errors="coerce")
+    stored = matrix.year_frame(year).reindex(index=values.index, columns=values.columns)
+    changed = ~((values == stored) | (values.isna() & stored.isna()))
+    values = values.fillna(0)
+
+    changes = {}
+    for month in values.columns[changed.any(axis=0).to_numpy()]:
+        filt = changed[month]
+        changes[f"{year}-{int(month):02d}"] = {
+            category: float(value) for category, value in values.loc[filt, month].items()
+        }
+    return changes
+
@@ -0,0 +1,285 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+# Processed transaction frames kept per worker. A few versions are retained
+# so callbacks still holding the previous handle resolve while a new one
+# propagates to the browser.
+MAX_TRANSACTION_VERSIONS = 8
+
+# Built reports and figures kept per worker, so flipping back to a view
+# already drawn with the same data and config skips the rebuild
+MAX_FIGURES = 64
+
+# Assembled configs kept per worker, keyed by household and a digest of
+# their content. The browser only holds a config version; each household's
+# current version expires so that settings changed by another worker are
+# picked up on a later page load.
+CONFIG_TTL = 10 * 60
+MAX_CONFIG_VERSIONS = 16
+
+# Parsed configs and projections of them (user settings, budget matrices),
+# keyed by household and config version
+MAX_PROJECTIONS = 64
+
+
+class LRU:
+    """
+    Thread-safe least-recently-used map.
+
+    Parameters
+    ----------
+    maxsize : int
+        Capacity, in entries or in the units returned by ``sizeof``.
+    sizeof : callable, optional
+        Weight of a value; each entry counts 1 if not given. A value
+        heavier than ``maxsize`` is not kept.
+    """
+
+    def __init__(self, maxsize, sizeof=None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the value for a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used, and return it."""
+        size = 1 if self.sizeof is None else self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size <= self.maxsize:
+                self._entries[key] = (value, size)
+                self.size += size
+            while self.size > self.maxsize:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+        return value
+
+    def discard(self, predicate=None):
+        """Drop the entries whose key matches ``predicate`` (all if not given)."""
+        with self._lock:
+            for key in list(self._entries):
+                if predicate is None or predicate(key):
+                    self.size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.size = self.hits = self.misses = 0
+
+    def info(self):
+        """Hit and miss counts, hit rate, entries and total size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "size": self.size,
+            }
+
+
+_transactions = LRU(MAX_TRANSACTION_VERSIONS)
+_figures = LRU(MAX_FIGURES)
+_config_versions = LRU(MAX_CONFIG_VERSIONS)
+_config_aliases = LRU(MAX_CONFIG_VERSIONS)
+_projections = LRU(MAX_PROJECTIONS)
+_configs = {}
+_households = {}
+_lock = threading.Lock()
+
+
+def put_transactions(household_id, version, frame, cube=None, daily_index=None, uid=None):
+    """
+    Cache a processed transactions frame and return its browser handle.
+
+    Parameters
+    ----------
+    household_id : str
+        Household the transactions belong to.
+    version : str
+        Token identifying this state of the data.
+    frame : pd.DataFrame
+        Processed transactions sorted by date. Callers must treat it as
+        read-only.
+    cube : pd.DataFrame, optional
+        Monthly cube of ``frame`` (see ``cube.build_cube``).
+    daily_index : dict, optional
+        Daily prefix sums of ``frame`` (see ``cube.build_daily_index``).
+    uid : str, optional
+        User the handle is issued to; see ``sync.authorize``.
+
+    Returns
+    -------
+    dict
+        Handle stored in ``transaction-data-store``.
+    """
+    _transactions.put((household_id, version),
+                      {"transactions": frame, "cube": cube,
+                       "daily_index": daily_index, "uid": uid})
+    return {"household_id": household_id, "version": version}
+
+
+def _get(handle, part):
+    if not handle:
+        return None
+    entry = _transactions.get((handle.get("household_id"), handle.get("version")))
+    return None if entry is None else entry[part]
+
+
+def get_transactions(handle):
+    """Return the cached frame for a handle, or None if it is not in this worker's cache."""
+    return _get(handle, "transactions")
+
+
+def get_cube(handle):
+    """Return the cached monthly cube for a handle, or None."""
+    return _get(handle, "cube")
+
+
+def get_daily_index(handle):
+    """Return the cached daily prefix-sum index for a handle, or None."""
+    return _get(handle, "daily_index")
+
+
+def get_transactions_uid(handle):
+    """Return the user a cached handle was issued to, or None."""
+    return _get(handle, "uid")
+
+
+def invalidate_transactions(household_id=None):
+    """
+    Drop cached frames and figures for a household (or all households).
+
+    The app never needs this: a fetch or edit mints a new transactions
+    version, so stale entries are simply no longer looked up and age out
+    of the LRU. It is for forcing a cold start (see ``sync.invalidate``).
+    """
+    if household_id is None:
+        _transactions.discard()
+        _figures.discard()
+    else:
+        _transactions.discard(lambda key: key[0] == household_id)
+        _figures.discard(lambda key: key[1] == household_id)
+
+
+def config_version(config_json):
+    """Short digest identifying a serialized config."""
+    return hashlib.blake2b(config_json.encode(), digest_size=8).hexdigest()
+
+
+def figure_key(chart, handle, *inputs):
+    """
+    Key for a built chart.
+
+    Parameters
+    ----------
+    chart : str
+        Name of the chart.
+    handle : dict
+        ``transaction-data-store`` handle the chart was built from; its
+        version changes whenever transactions are fetched or edited.
+    *inputs
+        Everything else the chart depends on (owner, dates, config
+        version, ...).
+    """
+    return (chart, handle.get("household_id"), handle.get("version")) + inputs
+
+
+def get_figure(key):
+    """Return the cached value for a figure key, or None."""
+    return _figures.get(key)
+
+
+def put_figure(key, value):
+    """Cache a built report or figure, evicting the least recently used."""
+    return _figures.put(key, value)
+
+
+def figure_cache_info():
+    """Hit and miss counts, hit rate and entries of the figure cache."""
+    info = _figures.info()
+    del info["size"]
+    return info
+
+
+def _fresh(entry):
+    return entry is not None and time.monotonic() - entry[1] < CONFIG_TTL
+
+
+def get_household(uid):
+    """Return the cached household id for a user, or None."""
+    with _lock:
+        entry = _households.get(uid)
+    return entry[0] if _fresh(entry) else None
+
+
+def get_current_version(household_id):
+    """Return the version of a household's cached config, or None if missing or expired."""
+    with _lock:
+        entry = _configs.get(household_id)
+    return entry[0] if _fresh(entry) else None
+
+
+def get_config(household_id, version):
+    """Return a household's config JSON for a version, or None if it is not in this worker's cache."""
+    return _config_versions.get((household_id, version))
+
+
+def put_config(uid, household_id, config_json):
+    """
+    Cache a household's config JSON as its current version.
+
+    Returns
+    -------
+    str
+        The version, ``config_version(config_json)``.
+    """
+    now = time.monotonic()
+    version = config_version(config_json)
+    _config_versions.put((household_id, version), config_json)
+    with _lock:
+        _households[uid] = (household_id, now)
+        _configs[household_id] = (version, now)
+    return version
+
+
+def get_config_alias(household_id, version):
+    """Return the version a household's unknown version was re-read as, or None."""
+    return _config_aliases.get((household_id, version))
+
+
+def put_config_alias(household_id, version, current):
+    """Record that a version this worker did not hold was re-read as ``current``."""
+    return _config_aliases.put((household_id, version), current)
+
+
+def get_projection(key):
+    """Return a cached projection, keyed by ``(household_id, version, name, *args)``, or None."""
+    return _projections.get(key)
+
+
+def put_projection(key, value):
+    """Cache a projection of a config version, evicting the least recently used."""
+    return _projections.put(key, value)
@@ -0,0 +1,179 @@
+import base64
+import hashlib
+import json
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from lib.utils import cache
+
+# Payloads start with this tag so the format can change without breaking
+# stores written by an older worker
+FORMAT_TAG = "bb1:"
+COMPRESSION_LEVEL = 1
+
+# Nullable extension arrays, encoded as their values plus an NA mask
+MASKED_ARRAYS = (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+
+# Decoded frames kept per worker, keyed by payload digest. Callbacks fired
+# by the same interaction receive the same payload, so only the first
+# decodes it.
+MAX_DECODED_BYTES = 256 * 1024 * 1024
+
+
+def _frame_bytes(frame):
+    return int(frame.memory_usage(index=False, deep=False).sum())
+
+
+_decoded = cache.LRU(MAX_DECODED_BYTES, sizeof=_frame_bytes)
+
+
+def _is_strings(series):
+    """Whether every non-null value is a string (every category, for a categorical)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.cat.categories
+    return pd.api.types.infer_dtype(series, skipna=True) in ("string", "empty")
+
+
+def encode_frame(df):
+    """
+    Encode a DataFrame as a compact string for ``dcc.Store``.
+
+    Columns are packed as raw numpy buffers: datetimes as int64
+    nanoseconds, numbers and booleans as-is, nullable integers, floats
+    and booleans (``Int64``, ``boolean``, ...) as values plus an NA mask,
+    and strings as int32 codes into a table of unique values. The result
+    is zlib-compressed and base64-wrapped. The index is not kept.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Frame to encode.
+
+    Returns
+    -------
+    str
+        Payload for ``decode_frame``.
+
+    Raises
+    ------
+    TypeError
+        If a column holds anything else (e.g. mixed objects or
+        timedeltas), rather than encoding it lossily.
+    """
+    columns = []
+    buffers = []
+    for name, series in df.items():
+        meta = {"name": name}
+        if isinstance(series.dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(series):
+            meta["kind"] = "datetime"
+            meta["tz"] = str(series.dt.tz) if series.dt.tz is not None else None
+            values = series.dt.tz_localize(None) if series.dt.tz is not None else series
+            data = values.to_numpy(dtype="datetime64[ns]").view("int64")
+        elif isinstance(series.array, MASKED_ARRAYS):
+            meta["kind"] = "masked"
+            meta["extension"] = series.dtype.name
+            values = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+            meta["dtype"] = values.dtype.str
+            data = np.concatenate([values.view("uint8"), series.isna().to_numpy().view("uint8")])
+        elif isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufc":
+            meta["kind"] = "numeric"
+            data = series.to_numpy()
+            meta["dtype"] = data.dtype.str
+        elif _is_strings(series):
+            meta["kind"] = "strings"
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            meta["values"] = list(uniques)
+            data = codes.astype("int32")
+        else:
+            raise TypeError(f"Cannot encode column {name!r} of dtype {series.dtype}")
+        meta["nbytes"] = data.nbytes
+        columns.append(meta)
+        buffers.append(np.ascontiguousarray(data).tobytes())
+
+    header = json.dumps({"rows": len(df), "columns": columns}).encode()
+    raw = struct.pack("<I", len(header)) + header + b"".join(buffers)
+    return FORMAT_TAG + base64.b64encode(zlib.compress(raw, COMPRESSION_LEVEL)).decode("ascii")
+
+
+def decode_frame(payload):
+    """
+    Decode a payload written by ``encode_frame``, memoized per worker.
+
+    Repeat payloads are served from an LRU keyed by their digest, evicted
+    once decoded frames exceed ``MAX_DECODED_BYTES``. Each call returns a
+    shallow copy, so callers may add or replace columns but must not
+    modify values in place.
+
+    Parameters
+    ----------
+    payload : str
+        Encoded frame.
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    key = payload_digest(payload)
+    frame = _decoded.get(key)
+    if frame is None:
+        frame = _decoded.put(key, _decode(payload))
+    return frame.copy(deep=False)
+
+
+def payload_digest(payload):
+    """Digest identifying a payload's contents."""
+    return hashlib.blake2b(payload.encode("ascii"), digest_size=16).digest()
+
+
+def decode_cache_info():
+    """Hit and miss counts, entries and bytes held by the ``decode_frame`` memo."""
+    info = _decoded.info()
+    return {
+        "hits": info["hits"],
+        "misses": info["misses"],
+        "entries": info["entries"],
+        "bytes": info["size"],
+    }
+
+
+def clear_decode_cache():
+    """Drop memoized frames and reset the counters."""
+    _decoded.clear()
+
+
+def _decode(payload):
+    """Decode a payload; numeric and date columns are read straight from the buffer."""
+    if not payload.startswith(FORMAT_TAG):
+        raise ValueError("Unrecognized store payload")
+    raw = bytearray(zlib.decompress(base64.b64decode(payload[len(FORMAT_TAG):])))
+    (header_length,) = struct.unpack_from("<I", raw)
+    header = json.loads(raw[4:4 + header_length])
+
+    offset = 4 + header_length
+    data = {}
+    for meta in header["columns"]:
+        if meta["kind"] == "datetime":
+            buffer = np.frombuffer(raw, dtype="int64", count=header["rows"], offset=offset)
+            values = pd.DatetimeIndex(buffer.view("datetime64[ns]"))
+            if meta["tz"]:
+                values = values.tz_localize(meta["tz"])
+        elif meta["kind"] == "numeric":
+            values = np.frombuffer(raw, dtype=np.dtype(meta["dtype"]), count=header["rows"], offset=offset)
+        elif meta["kind"] == "masked":
+            buffer = np.frombuffer(raw, dtype=np.dtype(meta["dtype"]), count=header["rows"], offset=offset)
+            mask = np.frombuffer(raw, dtype=bool, count=header["rows"], offset=offset + buffer.nbytes)
+            values = pd.array(buffer, dtype=meta["extension"])
+            values[mask] = pd.NA
+        elif meta["kind"] == "strings":
+            codes = np.frombuffer(raw, dtype="int32", count=header["rows"], offset=offset)
+            lookup = np.array(meta["values"] + [None], dtype=object)
+            values = lookup[codes]  # code -1 picks the trailing None
+        else:
+            raise ValueError(f"Unrecognized column kind {meta['kind']!r}")
+        data[meta["name"]] = values
+        offset += meta["nbytes"]
+
+    return pd.DataFrame(data, columns=[meta["name"] for meta in header["columns"]])
@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+import pytz
+
+# Dimensions of the monthly spending cube
+CUBE_KEYS = ["owner", "year", "month", "csp", "csp_label"]
+
+
+def aggregate_transactions(transactions):
+    """
+    Sum transactions by ``CUBE_KEYS``.
+
+    Parameters
+    ----------
+    transactions : pd.DataFrame
+        Processed transactions with ``date``, ``amount``, ``csp``,
+        ``csp_label`` and ``account_owner``.
+
+    Returns
+    -------
+    pd.DataFrame
+        ``amount`` and ``count`` indexed by ``CUBE_KEYS``.
+    """
+    keys = [
+        transactions['account_owner'].rename('owner'),
+        transactions['date'].dt.year.rename('year'),
+        transactions['date'].dt.month.rename('month'),
+        transactions['csp'],
+        transactions['csp_label'],
+    ]
+    # Cast so an owner without transactions doesn't turn the cube to object
+    grouped = transactions['amount'].astype(float).groupby(keys, dropna=False)
+    return pd.DataFrame({'amount': grouped.sum(), 'count': grouped.size()})
+
+
+def build_cube(transactions):
+    """Build the monthly cube for a set of transactions."""
+    return aggregate_transactions(transactions)
+
+
+def update_cube(cube, removed, added):
+    """
+    Apply a sync delta to a cube.
+
+    Parameters
+    ----------
+    cube : pd.DataFrame
+        Cube built from the previous transactions.
+    removed : pd.DataFrame
+        Previous versions of transactions that changed or were deleted.
+    added : pd.DataFrame
+        New versions of transactions that were inserted or changed.
+
+    Returns
+    -------
+    pd.DataFrame
+        Updated cube; cells left without transactions are dropped.
+    """
+    parts = [cube]
+    if not added.empty:
+        parts.append(aggregate_transactions(added))
+    if not removed.empty:
+        parts.append(-aggregate_transactions(removed))
+    if len(parts) == 1:
+        return cube
+    cube = pd.concat(parts).groupby(level=CUBE_KEYS, dropna=False).sum()
+    return cube.loc[cube['count'] != 0]
+
+
+def combine_cubes(cubes):
+    """Stack cubes for different owners."""
+    return pd.concat(cubes)
+
+
+def _utc_day(value):
+    return pd.Timestamp(value).tz_localize(None).normalize().tz_localize(pytz.UTC)
+
+
+def window_totals(cube, transactions, start_date, end_date, owner=None):
+    """
+    Monthly totals for an inclusive day range.
+
+    Months wholly inside the range are read from the cube. Partial months
+    at either end are aggregated from the raw transactions in just those
+    days, found by binary search, so the cost depends on the number of
+    categories and months rather than on the length of the history.
+
+    Parameters
+    ----------
+    cube : pd.DataFrame
+        Cube built from ``transactions``.
+    transactions : pd.DataFrame
+        Processed transactions sorted by ``date``.
+    start_date, end_date : datetime or str
+        First and last day of the range.
+    owner : str, optional
+        Restrict to one account owner.
+
+    Returns
+    -------
+    pd.DataFrame
+        ``CUBE_KEYS`` columns with ``amount`` and ``count``.
+    """
+    start = _utc_day(start_date)
+    end = _utc_day(end_date) + pd.Timedelta(days=1)
+
+    # Months wholly inside [start, end)
+    first_full = start if start.day == 1 else start + pd.offsets.MonthBegin(1)
+    last_full = end.replace(day=1)
+
+    parts = []
+    if first_full < last_full:
+        first = first_full.year * 12 + first_full.month - 1
+        last = last_full.year * 12 + last_full.month - 1
+        months = (cube.index.get_level_values('year') * 12
+                  + cube.index.get_level_values('month') - 1)
+        filt = (months >= first) & (months < last)
+        if owner is not None:
+            filt &= cube.index.get_level_values('owner') == owner
+        parts.append(cube.loc[filt])
+        raw_windows = [(start, first_full), (last_full, end)]
+    else:
+        raw_windows = [(start, end)]
+
+    # Rows in the partial months, aggregated together
+    dates = transactions['date']
+    positions = np.concatenate([
+        np.arange(dates.searchsorted(window_start), dates.searchsorted(window_end))
+        for window_start, window_end in raw_windows
+    ])
+    if len(positions):
+        rows = transactions.iloc[positions]
+        if owner is not None:
+            rows = rows.loc[rows['account_owner'] == owner]
+        if not rows.empty:
+            parts.append(aggregate_transactions(rows))
+
+    if not parts:
+        return pd.DataFrame(columns=CUBE_KEYS + ['amount', 'count'])
+    if len(parts) == 1:
+        return parts[0].reset_index()
+    return (
+        pd.concat(parts)
+        .groupby(level=CUBE_KEYS, dropna=False)
+        .sum()
+        .reset_index()
+    )
+
+
+def build_daily_index(transactions):
+    """
+    Build a daily prefix-sum index of spending by owner and category.
+
+    Row ``d + 1`` of the cumulative arrays holds the total amount and
+    transaction count through day ``d`` of the span for every
+    (owner, csp, csp_label) column, with a leading row of zeros, so any
+    day range is two row lookups and a subtraction.
+
+    Parameters
+    ----------
+    transactions : pd.DataFrame
+        Processed transactions.
+
+    Returns
+    -------
+    dict
+        ``start`` (first day, UTC), ``keys`` (one row per column),
+        ``cumulative`` and ``counts`` (days + 1 by keys arrays).
+    """
+    key_columns = [
+        transactions['account_owner'].rename('owner'),
+        transactions['csp'],
+        transactions['csp_label'],
+    ]
+    grouped = transactions['amount'].groupby(key_columns, dropna=False)
+    codes = grouped.ngroup().to_numpy()
+    keys = grouped.size().index.to_frame(index=False)
+
+    if transactions.empty:
+        return {"start": None, "keys": keys,
+                "cumulative": np.zeros((1, 0)), "counts": np.zeros((1, 0), dtype=int)}
+
+    days = transactions['date'].dt.tz_convert(pytz.UTC).dt.tz_localize(None).dt.normalize()
+    start = days.min()
+    day_numbers = ((days - start) // pd.Timedelta(days=1)).to_numpy()
+    n_days = int(day_numbers.max()) + 1
+
+    cells = (day_numbers + 1) * len(keys) + codes
+    shape = (n_days + 1, len(keys))
+    daily = np.bincount(cells, weights=transactions['amount'].to_numpy(dtype=float),
+                        minlength=shape[0] * shape[1]).reshape(shape)
+    counts = np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape)
+    return {
+        "start": start.tz_localize(pytz.UTC),
+        "keys": keys,
+        "cumulative": np.cumsum(daily, axis=0),
+        "counts": np.cumsum(counts, axis=0),
+    }
+
+
+def range_totals(daily_index, start_date, end_date, owner=None):
+    """
+    Totals by category for an inclusive day range from a daily index.
+
+    Parameters
+    ----------
+    daily_index : dict
+        Index from ``build_daily_index``.
+    start_date, end_date : datetime or str
+        First and last day of the range.
+    owner : str, optional
+        Restrict to one account owner.
+
+    Returns
+    -------
+    pd.DataFrame
+        ``owner``, ``csp``, ``csp_label`` and ``amount`` for categories
+        with transactions in the range.
+    """
+    keys = daily_index["keys"]
+    cumulative = daily_index["cumulative"]
+    counts = daily_index["counts"]
+    if daily_index["start"] is None:
+        return keys.assign(amount=0.0).iloc[0:0]
+
+    n_days = cumulative.shape[0] - 1
+    first = (_utc_day(start_date) - daily_index["start"]).days
+    last = (_utc_day(end_date) - daily_index["start"]).days + 1
+    first = min(max(first, 0), n_days)
+    last = min(max(last, first), n_days)
+
+    totals = keys.assign(amount=cumulative[last] - cumulative[first])
+    filt = (counts[last] - counts[first]) > 0
+    if owner is not None:
+        filt &= totals['owner'] == owner
+    return totals.loc[filt]
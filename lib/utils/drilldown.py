@@ -0,0 +1,198 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from lib.utils import cache, functions
+
+# Rows sent per infinite-grid block
+PAGE_SIZE = 100
+
+# Filtered and sorted row positions kept per worker, so scrolling through
+# a drill-down only slices and formats the next block
+MAX_CACHED_QUERIES = 32
+
+# Grid columns: field, header and filter
+COLUMNS = [
+    ("date", "Date", "agDateColumnFilter"),
+    ("plaidName", "Transaction", "agTextColumnFilter"),
+    ("amount", "Amount", "agNumberColumnFilter"),
+    ("category_name", "Category", "agTextColumnFilter"),
+    ("account_name", "Account", "agTextColumnFilter"),
+    ("notes", "Notes", "agTextColumnFilter"),
+]
+DEFAULT_SORT = [{"colId": "date", "sort": "desc"}]
+
+_orders = cache.LRU(MAX_CACHED_QUERIES)
+
+
+def column_defs():
+    """Column definitions for the drill-down grid."""
+    return [
+        {"field": field, "headerName": header, "filter": filter_type,
+         "filterParams": {"buttons": ["reset", "apply"], "closeOnApply": True}}
+        for field, header, filter_type in COLUMNS
+    ]
+
+
+def make_query(category, start_date, end_date, user):
+    """Describe the rows behind a clicked bar of the budget chart."""
+    return {"category": category, "start_date": start_date,
+            "end_date": end_date, "user": user}
+
+
+def select_rows(transactions, query):
+    """
+    Positions of the transactions behind a drill-down query.
+
+    The date range is found by binary search on the date-sorted frame;
+    only rows inside it are checked against owner and category.
+
+    Parameters
+    ----------
+    transactions : pd.DataFrame
+        Processed transactions sorted by ``date``.
+    query : dict
+        Query from ``make_query``.
+
+    Returns
+    -------
+    np.ndarray
+        Positional indices into ``transactions``.
+    """
+    start = pd.Timestamp(query["start_date"]).normalize().tz_localize("UTC")
+    end = pd.Timestamp(query["end_date"]).normalize().tz_localize("UTC") + pd.Timedelta(days=1)
+    dates = transactions['date']
+    first, last = dates.searchsorted(start), dates.searchsorted(end)
+    rows = transactions.iloc[first:last]
+
+    filt = rows['account_owner'] == query["user"]
+    if query["category"] == 'Total Spending':
+        filt &= rows['csp_label'] != 'income'
+    elif query["category"] == 'Total Income':
+        filt &= rows['csp_label'] == 'income'
+    else:
+        filt &= rows['csp'] == query["category"]
+    return first + np.flatnonzero(filt.to_numpy())
+
+
+def _condition_mask(values, condition):
+    """Mask for one AG Grid filter condition."""
+    kind = condition["type"]
+    if kind == "blank":
+        return values.isna()
+    if kind == "notBlank":
+        return values.notna()
+
+    if condition.get("filterType") == "text":
+        values = values.fillna("").astype(str).str.lower()
+        text = str(condition.get("filter", "")).lower()
+        masks = {
+            "contains": lambda: values.str.contains(text, regex=False),
+            "notContains": lambda: ~values.str.contains(text, regex=False),
+            "equals": lambda: values == text,
+            "notEqual": lambda: values != text,
+            "startsWith": lambda: values.str.startswith(text),
+            "endsWith": lambda: values.str.endswith(text),
+        }
+        return masks[kind]()
+
+    if condition.get("filterType") == "date":
+        values = values.dt.tz_localize(None).dt.normalize()
+        low = pd.Timestamp(condition.get("dateFrom"))
+        high = pd.Timestamp(condition.get("dateTo")) if condition.get("dateTo") else None
+    else:
+        low = condition.get("filter")
+        high = condition.get("filterTo")
+    masks = {
+        "equals": lambda: values == low,
+        "notEqual": lambda: values != low,
+        "greaterThan": lambda: values > low,
+        "greaterThanOrEqual": lambda: values >= low,
+        "lessThan": lambda: values < low,
+        "lessThanOrEqual": lambda: values <= low,
+        "inRange": lambda: (values >= low) & (values <= high),
+    }
+    return masks[kind]()
+
+
+def apply_filter(rows, filter_model):
+    """
+    Apply an AG Grid ``filterModel`` to a frame.
+
+    Supports the text, number and date filters, including two conditions
+    joined by ``AND``/``OR``.
+    """
+    filt = pd.Series(True, index=rows.index)
+    for column, model in (filter_model or {}).items():
+        if "conditions" in model:
+            masks = [_condition_mask(rows[column], c) for c in model["conditions"]]
+            if model.get("operator") == "OR":
+                mask = np.logical_or.reduce(masks)
+            else:
+                mask = np.logical_and.reduce(masks)
+        else:
+            mask = _condition_mask(rows[column], model)
+        filt &= mask
+    return rows.loc[filt]
+
+
+def apply_sort(rows, sort_model):
+    """Order a frame by an AG Grid ``sortModel`` (newest first by default)."""
+    sort_model = sort_model or DEFAULT_SORT
+    return rows.sort_values(
+        [s["colId"] for s in sort_model],
+        ascending=[s["sort"] == "asc" for s in sort_model],
+        kind="stable",
+        na_position="last",
+    )
+
+
+def _ordered_rows(transactions, key, query, request):
+    """Filtered, sorted positions for a request, memoized per worker."""
+    memo_key = (
+        key,
+        json.dumps(query, sort_keys=True),
+        json.dumps(request.get("sortModel"), sort_keys=True),
+        json.dumps(request.get("filterModel"), sort_keys=True),
+    )
+    positions = _orders.get(memo_key)
+    if positions is not None:
+        return positions
+
+    rows = transactions.iloc[select_rows(transactions, query)]
+    rows = apply_filter(rows, request.get("filterModel"))
+    rows = apply_sort(rows, request.get("sortModel"))
+    positions = transactions.index.get_indexer(rows.index)
+
+    return _orders.put(memo_key, positions)
+
+
+def get_rows(transactions, key, query, request):
+    """
+    Answer an infinite-model ``getRowsRequest`` from the cached frame.
+
+    Parameters
+    ----------
+    transactions : pd.DataFrame
+        Processed transactions sorted by ``date`` with a unique index.
+    key : tuple
+        Identifies this version of ``transactions``; filtered and sorted
+        positions are memoized under it.
+    query : dict
+        Query from ``make_query``.
+    request : dict
+        ``getRowsRequest`` with ``startRow``, ``endRow``, ``sortModel``
+        and ``filterModel``.
+
+    Returns
+    -------
+    dict
+        ``getRowsResponse`` with the formatted block and total row count.
+    """
+    positions = _ordered_rows(transactions, key, query, request)
+    page = positions[request["startRow"]:request["endRow"]]
+    return {
+        "rowData": functions.format_table(transactions.iloc[page]).to_dict(orient="records"),
+        "rowCount": len(positions),
+    }
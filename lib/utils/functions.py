@@ -4,72 +4,284 @@ import numpy as np
 import os
 import pandas as pd
 import plotly.graph_objects as go
+from dash import Patch
 import glob
+import hashlib
 import pytz
 from flask import session
 
-def process_transactions(df, config):
-    category_names = config["cat_names"]
-    csp_from_group = config["csp_from_group"]
-    csp_from_category = config["csp_from_category"]
-    csp_labels = config["csp_labels"]
-    drop_cats = config["drop_cats"]
-    
-    # Assign labels
-    df["category_group"] = df["category_name"].map(category_names)
-    df = df.assign(
-        csp_from_group=df["category_group"].map(csp_from_group),
-        csp_from_category=df["category_name"].map(csp_from_category),
-        csp=lambda x: x["csp_from_group"].fillna(x["csp_from_category"]).fillna("guilt_free"),
-        csp_label=lambda x: x["csp"].map(csp_labels)
+from lib.utils import cache, cube
+from lib.utils.store import household_path, user_path
+
+# Normalized Monarch transaction, as written to Firestore before labelling
+TRANSACTION_SCHEMA = {
+    "id": "object",
+    "date": "datetime64[ns, UTC]",
+    "amount": "float64",
+    "plaidName": "object",
+    "notes": "object",
+    "category_name": "object",
+    "account_name": "object",
+    "merchant_name": "object",
+    "hideFromReports": "bool",
+}
+
+# User config settings that determine transaction labels
+CATEGORY_MAP_KEYS = [
+    "cat_names", "csp_from_group", "csp_from_category", "csp_labels", "drop_cats"
+]
+
+# Compiled category lookup tables kept per worker, keyed by a hash of
+# CATEGORY_MAP_KEYS
+MAX_CATEGORY_MAPS = 16
+
+_category_maps = cache.LRU(MAX_CATEGORY_MAPS)
+
+# Stored fields that identify a change to a transaction
+HASH_FIELDS = [
+    "date", "amount", "csp", "csp_label", "category_name", "account_name",
+    "plaidName", "notes"
+]
+
+def _column(frame, name, default):
+    if name in frame:
+        return frame[name]
+    return pd.Series(default, index=frame.index)
+
+
+def _nested(frame, name, key):
+    """Read ``key`` from a column of nested Monarch objects (dicts or None)."""
+    if name not in frame or frame[name].isna().all():
+        return pd.Series("", index=frame.index)
+    return frame[name].str.get(key).fillna("").astype(str)
+
+
+def normalize_transactions(records):
+    """
+    Flatten Monarch transaction results into ``TRANSACTION_SCHEMA``.
+
+    Nested ``category``, ``account`` and ``merchant`` objects are read
+    once per column rather than row by row, and every other Monarch
+    field is dropped.
+
+    Parameters
+    ----------
+    records : list[dict] or pd.DataFrame
+        ``allTransactions.results`` from Monarch, or a frame of them
+        (e.g. the legacy raw-transactions pickle).
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per transaction with the schema's columns and dtypes.
+    """
+    if isinstance(records, pd.DataFrame):
+        frame = records.reset_index(drop=True)
+    else:
+        frame = pd.DataFrame.from_records(records)
+
+    if frame.empty:
+        return pd.DataFrame({
+            name: pd.Series(dtype=dtype) for name, dtype in TRANSACTION_SCHEMA.items()
+        })
+
+    normalized = pd.DataFrame({
+        "id": frame["id"].astype(str),
+        "date": pd.to_datetime(frame["date"], utc=True),
+        "amount": pd.to_numeric(frame["amount"]),
+        "plaidName": _column(frame, "plaidName", "").fillna("").astype(str),
+        "notes": _column(frame, "notes", "").fillna("").astype(str),
+        "category_name": _nested(frame, "category", "name"),
+        "account_name": _nested(frame, "account", "displayName"),
+        "merchant_name": _nested(frame, "merchant", "name"),
+        "hideFromReports": _column(frame, "hideFromReports", False).fillna(False),
+    })
+
+    return normalized.astype(TRANSACTION_SCHEMA)
+
+
+def compile_category_map(config):
+    """
+    Compile a user config's category mappings into a lookup table.
+
+    Every known Monarch category gets one row holding its group, CSP,
+    CSP label and drop flag; a final row holds the values for categories
+    the config does not mention. Tables are cached by a hash of the
+    mapping settings, so a config is only compiled once.
+
+    Parameters
+    ----------
+    config : dict
+        User config with ``cat_names``, ``csp_from_group``,
+        ``csp_from_category``, ``csp_labels`` and ``drop_cats``.
+
+    Returns
+    -------
+    pd.DataFrame
+        Lookup table indexed by category name.
+    """
+    settings = {key: config[key] for key in CATEGORY_MAP_KEYS}
+    digest = hashlib.sha1(
+        json.dumps(settings, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    table = _category_maps.get(digest)
+    if table is not None:
+        return table
+
+    categories = pd.Index(
+        sorted(set(settings["cat_names"]) | set(settings["csp_from_category"])
+               | set(settings["drop_cats"])),
+        dtype=object
     )
 
+    # The last row stands in for categories missing from the config
+    category_group = categories.map(settings["cat_names"]).append(pd.Index([np.nan]))
+    csp_from_category = categories.map(settings["csp_from_category"]).append(pd.Index([np.nan]))
+    table = pd.DataFrame({
+        "category_group": category_group,
+        "csp_from_group": category_group.map(settings["csp_from_group"]),
+        "csp_from_category": csp_from_category,
+    }, index=categories.append(pd.Index([None])))
+    table["csp"] = table["csp_from_group"].fillna(table["csp_from_category"]).fillna("guilt_free")
+    table["csp_label"] = table["csp"].map(settings["csp_labels"])
+    table["drop"] = table.index.isin(settings["drop_cats"])
+
+    return _category_maps.put(digest, table)
+
+
+def process_transactions(df, config):
+    """
+    Label transactions with CSP categories and drop excluded ones.
+
+    Labels come from ``compile_category_map``: each transaction's
+    category is turned into an integer position in the lookup table and
+    every label column is gathered with it.
+    """
+    table = compile_category_map(config)
+
+    codes = table.index[:-1].get_indexer(df["category_name"])
+    codes[codes < 0] = len(table) - 1
+
+    df = df.assign(**{
+        column: table[column].to_numpy()[codes]
+        for column in ["category_group", "csp_from_group", "csp_from_category", "csp", "csp_label"]
+    })
+
     # Drop transactions
-    df = df.loc[~df["category_name"].isin(drop_cats) & ~df["hideFromReports"]]
+    df = df.loc[~table["drop"].to_numpy()[codes] & ~df["hideFromReports"].to_numpy(dtype=bool)]
 
     return df
 
 
-def find_household_for_user(db, uid):
-    households_ref = db.collection("households")
-    query = households_ref.where("members", "array_contains", uid).limit(1)
-    docs = query.stream()
-    
-    for doc in docs:
-        return doc.id  # first (and only) match
-    
-    return None
+def find_household_for_user(store, uid):
+    household_id, _ = store.find_household(uid)
+    return household_id
+
+
+
+def content_hash(df):
+    """
+    Stable hash of the stored content of each transaction.
+
+    Only ``HASH_FIELDS`` are hashed, in a normalized form, so a frame
+    read back from the store hashes the same as the freshly processed
+    frame it was written from.
+
+    Returns
+    -------
+    pd.Series
+        16-character hex digests aligned with ``df``.
+    """
+    if df.empty:
+        return pd.Series(index=df.index, dtype=object)
+    normalized = pd.DataFrame({
+        field: df[field] if field in df else "" for field in HASH_FIELDS
+    }, index=df.index)
+    normalized["date"] = pd.to_datetime(normalized["date"], utc=True).dt.strftime("%Y-%m-%d")
+    normalized["amount"] = pd.to_numeric(normalized["amount"]).round(2)
+    text_fields = [field for field in HASH_FIELDS if field not in ("date", "amount")]
+    normalized[text_fields] = normalized[text_fields].fillna("").astype(str)
+    hashes = pd.util.hash_pandas_object(normalized, index=False)
+    return hashes.map("{:016x}".format)
+
+
+def diff_transactions(old_txns, new_txns):
+    """
+    Compare stored and fetched transactions by id and content hash.
+
+    Parameters
+    ----------
+    old_txns : pd.DataFrame
+        Stored transactions in the refreshed range. A ``content_hash``
+        column is used where present, otherwise it is computed.
+    new_txns : pd.DataFrame
+        Processed transactions with a ``content_hash`` column.
+
+    Returns
+    -------
+    pd.DataFrame, list
+        New or changed rows of ``new_txns`` and ids of stored
+        transactions that are no longer present.
+    """
+    if old_txns.empty:
+        return new_txns, []
 
+    old_hashes = content_hash(old_txns)
+    if "content_hash" in old_txns:
+        old_hashes = old_txns["content_hash"].fillna(old_hashes)
+    old_hashes = pd.Series(old_hashes.values, index=old_txns["id"].astype(str))
 
+    new_ids = new_txns["id"].astype(str)
+    unchanged = new_txns["content_hash"].values == new_ids.map(old_hashes).values
+    deleted = old_hashes.index[~old_hashes.index.isin(new_ids)].tolist()
 
-def update_transactions(db, existing_transactions, new_transactions, 
-                         start_date, end_date, config_json):
+    return new_txns.loc[~unchanged], deleted
+
+
+def tombstone(txn_id):
+    """Record marking a transaction as deleted."""
+    return {"id": txn_id, "deleted": True}
+
+
+def plan_transaction_updates(store, existing_transactions, new_transactions,
+                             start_date, end_date, config_json, uid=None):
     """
-    Update Firestore by replacing transactions for a given date range.
+    Work out the writes that bring a date range up to date.
+
+    New transactions are normalized, split by account owner, labelled and
+    hashed, then diffed against the stored transactions in the range.
+    Removed documents are replaced by tombstones so that
+    ``sync.sync_collection`` can pick up the change incrementally.
 
     Parameters
     ----------
+    store : TransactionStore
+        Store the stored transactions are read from.
     existing_transactions : pd.DataFrame
         Current loaded transactions.
-    new_transactions : pd.DataFrame
-        New Monarch transactions to process.
+    new_transactions : list[dict] or pd.DataFrame
+        New Monarch transactions to normalize and process.
     start_date : datetime
         Start date for filtering.
     end_date : datetime
         End date for filtering.
-    config_json : dict
-        Configuration settings.
+    config_json : str
+        JSON-serialized config.
+    uid : str, optional
+        Firebase user id; read from the Flask session if not given.
 
     Returns
     -------
-    pd.DataFrame
-        Updated combined transactions.
+    list, list
+        Upsert and tombstone operations for ``store.write_transactions``.
     """
     utc = pytz.UTC
     start_date = start_date.replace(tzinfo=utc)
     end_date = end_date.replace(tzinfo=utc)
     
-    uid = session.get("user_id")
+    if uid is None:
+        uid = session.get("user_id")
     if not uid:
         raise ValueError("Error: User not logged in.")
     
@@ -97,8 +309,7 @@ def update_transactions(db, existing_transactions, new_transactions,
         raise ValueError("Error: No household config found for 'joint'")
 
     # Step 1: Prepare new_transactions
-    new_transactions["category_name"] = new_transactions["category"].apply(lambda x: x.get("name", "") if isinstance(x, dict) else "")
-    new_transactions["account_name"] = new_transactions["account"].apply(lambda x: x.get("displayName", "") if isinstance(x, dict) else "")
+    new_transactions = normalize_transactions(new_transactions)
 
     account_owner_map = config.get("account_owner", {})
 
@@ -118,58 +329,47 @@ def update_transactions(db, existing_transactions, new_transactions,
     user_txns = process_transactions(user_txns, user_config)
     joint_txns = process_transactions(joint_txns, household_config)
 
-    user_txns["account_owner"] = name
+    user_txns["account_owner"] = user_name
     joint_txns["account_owner"] = "joint"
 
-    # Step 2: Delete old transactions from Firestore
+    user_txns["content_hash"] = content_hash(user_txns)
+    joint_txns["content_hash"] = content_hash(joint_txns)
 
-    # Define collection refs
-    user_ref = db.collection("users").document(uid).collection("transactions")
-    household_id = find_household_for_user(db, uid)
-    household_ref = db.collection("households").document(household_id).collection("transactions")
+    # Step 2: Diff against stored transactions in the date range
+
+    # Define parent documents
+    user_parent = user_path(uid)
+    household_parent = household_path(find_household_for_user(store, uid))
 
     # Filter old transactions
     filt = (existing_transactions['date'] >= start_date) & (existing_transactions['date'] <= end_date)
     old_txns = existing_transactions.loc[filt]
 
     # Identify which ones belong to user vs joint
-    old_user_txn_ids = old_txns.loc[old_txns['account_owner'] == user_config.get("name", "user"), "id"].tolist()
-    old_joint_txn_ids = old_txns.loc[old_txns['account_owner'] == "joint", "id"].tolist()
-
-    # Delete them
-    batch = db.batch()
-    for txn_id in old_user_txn_ids:
-        batch.delete(user_ref.document(str(txn_id)))
-    for txn_id in old_joint_txn_ids:
-        batch.delete(household_ref.document(str(txn_id)))
-    batch.commit()
-
-    # Step 3: Upload new ones
-    batch = db.batch()
-    for txn in user_txns.drop(columns=["category", "account", "merchant"], errors="ignore").to_dict(orient="records"):
-        batch.set(user_ref.document(str(txn["id"])), txn)
-    for txn in joint_txns.drop(columns=["category", "account", "merchant"], errors="ignore").to_dict(orient="records"):
-        batch.set(household_ref.document(str(txn["id"])), txn)
-    batch.commit()
-
-    # Step 4: Update local combined dataset
-    filtered_transactions = existing_transactions.loc[~filt]
-    updated_transactions = pd.concat([filtered_transactions, user_txns, joint_txns])
-    updated_transactions = updated_transactions.sort_values('date', ascending=False)
-
-    return updated_transactions
-
-
-def read_budget(config, user):
-    budget_dict = config['users'][user]['budget']
-
-    budget = pd.DataFrame({
-        (int(year), int(month)): values 
-        for year, months in budget_dict.items() 
-        for month, values in months.items()
-    })
+    old_user_txns = old_txns.loc[old_txns['account_owner'] == user_name]
+    old_joint_txns = old_txns.loc[old_txns['account_owner'] == "joint"]
 
-    return budget
+    user_changed, user_deleted = diff_transactions(old_user_txns, user_txns)
+    joint_changed, joint_deleted = diff_transactions(old_joint_txns, joint_txns)
+
+    print(f"{user_name}: {len(user_changed)} new or changed, {len(user_deleted)} removed; "
+          f"joint: {len(joint_changed)} new or changed, {len(joint_deleted)} removed")
+
+    # Removed transactions are tombstoned so incremental syncs see them
+    deletes = [
+        (user_parent, tombstone(txn_id)) for txn_id in user_deleted
+    ] + [
+        (household_parent, tombstone(txn_id)) for txn_id in joint_deleted
+    ]
+
+    # Step 3: Upload new and changed ones; the store stamps updated_at
+    upserts = [
+        (user_parent, txn) for txn in user_changed.to_dict(orient="records")
+    ] + [
+        (household_parent, txn) for txn in joint_changed.to_dict(orient="records")
+    ]
+
+    return upserts, deletes
 
 
 def calc_proportions(df):
@@ -193,26 +393,22 @@ def calc_proportions(df):
     return df
 
 
-def build_budget_report(transactions, budget, start_date, end_date, config, user):
+def build_budget_report(transactions, budget, start_date, end_date, config, user,
+                        daily_index=None):
     # Ensure start_date and end_date are timezone-aware in UTC
     utc = pytz.UTC
     start_date = start_date.replace(tzinfo=utc)
     end_date = end_date.replace(tzinfo=utc)
-    # Subset transactions by date
-    filt = (
-        (transactions['date'] >= start_date) & 
-        (transactions['date'] <= end_date) &
-        (transactions['account_owner'] == user)
-    )
-    transactions = transactions.loc[filt, :]
 
-    # Sum spending for period
-    spend = transactions.groupby(['csp', 'csp_label'])['amount'].sum().abs()
+    # Sum spending for period from daily prefix sums (built here if not cached)
+    if daily_index is None:
+        daily_index = cube.build_daily_index(transactions)
+    totals = cube.range_totals(daily_index, start_date, end_date, owner=user)
+    spend = totals.groupby(['csp', 'csp_label'])['amount'].sum().abs()
     spend = spend.reset_index()
 
-    # Sum budget for period
-    period_budget = budget.loc[:, (start_date.year, start_date.month):(end_date.year, end_date.month)]
-    total_budget = period_budget.sum(axis=1)
+    # Sum budget for period from the matrix prefix sums
+    total_budget = budget.period_totals(start_date, end_date)
     total_budget = total_budget[total_budget>0]
     total_budget.name = 'budget'
 
@@ -273,53 +469,147 @@ def build_budget_report(transactions, budget, start_date, end_date, config, user
     return df_ordered
 
 
-def plot_report(budget_report, start_date, end_date):
-    green = '#78C2AD'
-    yellow = '#FFCE67'
-    red = '#F3969A'
-    body = '#888'
-    heading = '#5a5a5a'
-
-    x = abs(budget_report['proportion'])
-    y = budget_report['category']
-    text = budget_report['amount'] / budget_report['budget'] 
-    hover_text = budget_report['amount']
-
-    def stoplight_system(row):
-        prop = (row['amount'] / row['budget']) if row['budget'] else row['amount']
-        if row['csp_label'] == 'income':
-            return green if prop > 0.99 else yellow if prop >= 0.8 else red
-        else:
-            return red if prop > 1.01 else yellow if prop >= 0.8 else green
+# Colours of the budget chart
+GREEN = '#78C2AD'
+YELLOW = '#FFCE67'
+RED = '#F3969A'
+BODY = '#888'
+HEADING = '#5a5a5a'
+
+BAR_WIDTH = 0.8
+REPORT_GROUPS = ['Income', 'Guilt Free', 'Fixed Costs', 'Investments', 'Savings']
+BOLD_LABELS = ['Total Income', 'Total Spending'] + REPORT_GROUPS
+
+# Fixed position of the "Today" line among the budget chart's shapes
+# (after the group separators), so a date change can be sent as a Patch
+TODAY_SHAPE = len(REPORT_GROUPS)
+
+
+def _report_values(budget_report, start_date, end_date):
+    """Everything in the budget chart that depends on amounts or dates."""
+    amount = budget_report['amount'].to_numpy(dtype=float)
+    budget = budget_report['budget'].to_numpy(dtype=float)
+    remain = budget_report['remaining'].to_numpy(dtype=float)
+    income = (budget_report['csp_label'] == 'income').to_numpy()
+
+    # Stoplight colours: proportion of budget used (amount if no budget)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        used = amount / budget
+        prop = np.where(budget != 0, used, amount)
+    marker_color = np.where(
+        income,
+        np.select([prop > 0.99, prop >= 0.8], [GREEN, YELLOW], RED),
+        np.select([prop > 1.01, prop >= 0.8], [RED, YELLOW], GREEN),
+    )
+
+    def money(values, template):
+        return np.array([template.format(value) for value in values], dtype=object)
+
+    budget_text = np.where(budget > 0, money(budget, '$ {:,.0f}'), '')
+
+    # Remaining, flagged when over (spending) or ahead (income)
+    over = remain < 0
+    remaining_text = np.select(
+        [over & income, over, remain >= 0],
+        [money(np.abs(remain), '<b>+ ${:,.0f}!</b>'),
+         money(np.abs(remain), '<b>$ ({:,.0f})</b>'),
+         money(remain, '$ {:,.0f}')],
+        '',
+    )
+    remaining_color = np.select([over & income, over], [GREEN, RED], BODY)
+
+    # Line for today, left-labelled near the start of the range
+    start_to_today = (dt.today() - start_date).days
+    total_days = (end_date - start_date).days
+    progress = start_to_today / total_days if total_days else -1
+    today = {
+        'x': progress,
+        'xanchor': 'left' if progress < 0.1 else 'right',
+        'visible': bool(0 < progress <= 1),
+    }
+
+    return {
+        'x': np.abs(budget_report['proportion'].to_numpy(dtype=float)),
+        'text': np.where(np.isfinite(used), used, np.nan),  # no label without a budget
+        'hovertext': amount,
+        'marker_color': marker_color,
+        'budget_text': budget_text,
+        'budget_visible': budget > 0,
+        'remaining_text': remaining_text,
+        'remaining_color': remaining_color,
+        'remaining_visible': ~np.isnan(remain),
+        'today': today,
+    }
 
-    marker_color = budget_report.apply(stoplight_system, axis=1)
-    
-    bar_width = 0.8
-    
-    fig = go.Figure()
 
-    fig.add_trace(go.Bar(
-        x=x, 
+def _report_annotations(values, n_rows):
+    """Column headers, the "Today" label, then a budget and a remaining label per row."""
+    today = values['today']
+    annotations = [
+        dict(x=1.31, y=n_rows+.05, xanchor='right', text='<b>Budget<b>',
+             font_color=HEADING, showarrow=False),
+        dict(x=1.36, y=n_rows+.05, xanchor='left', text='<b>Remaining<b>',
+             font_color=HEADING, showarrow=False),
+        dict(x=today['x'], y=n_rows, xanchor=today['xanchor'], text='Today',
+             font_color=BODY, showarrow=False, visible=today['visible']),
+    ]
+    annotations += [
+        dict(x=1.31, y=idx, xanchor='right', text=text, font_color=BODY,
+             showarrow=False, visible=visible)
+        for idx, (text, visible) in enumerate(zip(
+            values['budget_text'].tolist(), values['budget_visible'].tolist()))
+    ]
+    annotations += [
+        dict(x=1.36, y=idx, xanchor='left', text=text, font_color=color,
+             showarrow=False, visible=visible)
+        for idx, (text, color, visible) in enumerate(zip(
+            values['remaining_text'].tolist(), values['remaining_color'].tolist(),
+            values['remaining_visible'].tolist()))
+    ]
+    return annotations
+
+
+def plot_report(budget_report, start_date, end_date):
+    values = _report_values(budget_report, start_date, end_date)
+    y = budget_report['category'].to_numpy()
+    n_rows = len(y)
+    today = values['today']
+
+    bar = go.Bar(
+        x=values['x'], 
         y=y,
         name='Budget',
         orientation='h',
-        marker_color=marker_color,
-        hovertext=hover_text,
+        marker_color=values['marker_color'],
+        hovertext=values['hovertext'],
         # hoverinfo='x', 
         hovertemplate='Actual: $%{hovertext:,.2f} <extra></extra>',
         hoverlabel=dict(bgcolor='#888', bordercolor='#888', 
                         font=dict(color='white')),
-        text=text, 
+        text=values['text'], 
         textposition='auto',
         texttemplate='%{text:.0%}',
         textfont=dict(size=10, color='white'),
         insidetextanchor='start',
-        width=bar_width,
+        width=BAR_WIDTH,
         showlegend=False,
         legendgroup='Fixed Costs'
-    ))
+    )
 
-    fig.update_layout(
+    # Line for each group, then the line for today
+    row_of = {label: idx for idx, label in enumerate(y)}
+    shapes = [
+        dict(type='line', x0=0, y0=row_of[group], x1=1.45, y1=row_of[group],
+             line=dict(width=.5, color='grey'), layer='below', opacity=.6)
+        for group in REPORT_GROUPS
+    ]
+    shapes.append(
+        dict(type='line', x0=today['x'], x1=today['x'],
+             y0=0-BAR_WIDTH/2, y1=n_rows-BAR_WIDTH/2,
+             line=dict(color=BODY, dash='dot'), visible=today['visible'])
+    )
+
+    layout = go.Layout(
         # title=go.layout.Title(text="Planned vs Actual", 
         #                       font=dict(color=heading)),
         xaxis=dict(showgrid=False, 
@@ -328,132 +618,50 @@ def plot_report(budget_report, start_date, end_date):
         paper_bgcolor='white',
         plot_bgcolor='white',
         barmode='relative', # in case negative values
-        annotations=[
-            go.layout.Annotation(
-                x=1.31, y=len(y)+.05,
-                xanchor='right',
-                text='<b>Budget<b>',
-                font_color=heading,
-                showarrow=False
-            ),
-            go.layout.Annotation(
-                x=1.36, y=len(y)+.05,
-                xanchor='left',
-                text='<b>Remaining<b>',
-                font_color=heading,
-                showarrow=False
-            )
-        ],
-        height=max(45, len(budget_report) * 30),
+        annotations=_report_annotations(values, n_rows),
+        shapes=shapes,
+        height=max(45, n_rows * 30),
         margin=dict(l=180, t=10, b=10, pad=10),
         yaxis=dict(
             visible=True,
             scaleanchor="x",  # Ensures proportional scaling
+            tickfont=dict(color=BODY),
+            tickvals=np.arange(n_rows),
+            ticktext=[f'<b>{label}</b>' if label in BOLD_LABELS 
+                        else label for label in y]
         ),
     )
-    
-    # Add budget annotation
-    for idx, budget in enumerate(budget_report['budget']):
-        if budget > 0:
-            fig.add_annotation(
-                x=1.31, y=idx,
-                xanchor='right',
-                text=f'$ {budget:,.0f}',
-                font_color=body,
-                showarrow=False
-            )
-    
-    # Add remaining annotation
-    for idx, (remain, label) in enumerate(zip(budget_report['remaining'],budget_report['csp_label'])):
-        if remain >= 0:
-            fig.add_annotation(
-                x=1.36, y=idx,
-                xanchor='left',
-                text=f'$ {remain:,.0f}',
-                font_color=body,
-                showarrow=False
-            )
-        elif remain < 0:
-            fig.add_annotation(
-                x=1.36, y=idx,
-                xanchor='left',
-                text=f'<b>+ ${abs(remain):,.0f}!</b>' if label == 'income' else f'<b>$ ({abs(remain):,.0f})</b>',
-                font_color = green if label == 'income' else red,
-                showarrow=False
-            )
-    
-    
-    # Add line for each Group
-    for group in ['Income', 'Guilt Free', 'Fixed Costs', 'Investments', 
-                  'Savings']:
-        fig.add_shape(
-            type='line',
-            x0=0,
-            y0=y.tolist().index(group),
-            x1=1.45,
-            y1=y.tolist().index(group),
-            line=dict(
-                width=.5,
-                color='grey'
-            ),
-            layer='below',
-            opacity=.6
-        )
 
-    # Add line for today
-    start_to_today = (dt.today() - start_date).days
-    total_days = (end_date - start_date).days
-    progress = start_to_today/total_days
-    
-    if progress > 0 and progress < 0.1:
-        fig.add_shape(
-            type='line',
-            x0=progress,
-            x1=progress,
-            y0=0-bar_width/2,
-            y1=len(y)-bar_width/2,
-            line=dict(color=body, dash='dot')
-        )
-    
-        fig.add_annotation(
-                    x=progress, y=len(y),
-                    xanchor='left',
-                    text='Today',
-                    font_color = body,
-                    showarrow=False
-                )
-        
-    elif progress >= 0.1 and progress <=1:
-        fig.add_shape(
-            type='line',
-            x0=progress,
-            x1=progress,
-            y0=0-bar_width/2,
-            y1=len(y)-bar_width/2,
-            line=dict(color=body, dash='dot')
-        )
-        
-        fig.add_annotation(
-                    x=progress, y=len(y),
-                    xanchor='right',
-                    text='Today',
-                    font_color = body,
-                    showarrow=False
-                )
-    
-    else:
-        pass
-
-    # Update y axis labels
-    fig.update_yaxes(
-        tickfont=dict(color=body),
-        tickvals=np.arange(len(y)),
-        ticktext=[f'<b>{label}</b>' if label in [
-            'Total Income', 'Total Spending', 'Income', 'Guilt Free', 
-            'Fixed Costs', 'Investments', 'Savings'] 
-                    else label for label in y]
-        )
-    
+    return go.Figure(data=[bar], layout=layout)
+
+
+def patch_report(budget_report, start_date, end_date):
+    """
+    Patch a figure from ``plot_report`` with new amounts and dates.
+
+    Only valid when ``budget_report`` has the same categories, in the
+    same order, as the report the figure was built from: bar arrays are
+    replaced in place, the annotations are replaced as one list and the
+    rest of the layout is left alone.
+
+    Returns
+    -------
+    dash.Patch
+    """
+    values = _report_values(budget_report, start_date, end_date)
+    today = values['today']
+
+    fig = Patch()
+    bar = fig['data'][0]
+    bar['x'] = values['x']
+    bar['text'] = values['text']
+    bar['hovertext'] = values['hovertext']
+    bar['marker']['color'] = values['marker_color']
+
+    fig['layout']['annotations'] = _report_annotations(values, len(budget_report))
+    fig['layout']['shapes'][TODAY_SHAPE].update(
+        {'x0': today['x'], 'x1': today['x'], 'visible': today['visible']}
+    )
     return fig
 
 # def plot_report(budget_report, start_date, end_date):
@@ -642,7 +850,7 @@ def plot_report(budget_report, start_date, end_date):
 
 
 def format_table(transactions):
-    '''prettifies transactions table for display'''
+    '''prettifies transactions for the drill-down grid (sorting is done by the caller)'''
     transactions_pretty = transactions.copy()
     # format Amount
     transactions_pretty['amount'] = (
@@ -659,11 +867,11 @@ def format_table(transactions):
         'date', 'plaidName','amount', 'category_name', 'account_name', 'notes'
     ]
     transactions_pretty = transactions_pretty.loc[:, pretty_cols]
-    transactions_pretty.columns = [
-        "Date", "Transaction", "Amount", "Category", "Account", "Notes"
-    ]
     
-    transactions_pretty.sort_values('Date', inplace=True, ascending=False)
+    # blank out missing values so rows serialize to JSON
+    transactions_pretty = transactions_pretty.astype(object).where(
+        transactions_pretty.notna(), None
+    )
     
     return transactions_pretty
 
@@ -689,10 +897,9 @@ def order_budget(budget, config, user):
 
     return budget
 
-def plot_csp_by_label(processed_transactions, as_percent):
-    df = processed_transactions.groupby([processed_transactions['date'].dt.year, 'csp_label'])['amount'].sum().reset_index()
+def plot_csp_by_label(monthly_totals, as_percent):
+    df = monthly_totals.groupby(['year', 'csp_label'])['amount'].sum().reset_index()
     df.columns = ['date', 'csp_label', 'value']
-    df = df.loc[df['date'] >= 2020]
     df['value'] = df['value'].abs()
 
     # Define the desired order
@@ -701,17 +908,16 @@ def plot_csp_by_label(processed_transactions, as_percent):
     # Pivot the DataFrame to reshape it for calculations
     pivot_df = df.pivot(index="date", columns="csp_label", values="value").fillna(0)
 
-    # Ensure all desired categories are in the DataFrame
-    for col in desired_order:
-        if col not in pivot_df.columns:
-            pivot_df[col] = 0
+    # Ensure all desired categories and income are in the DataFrame, even
+    # for windows without income (or without any transactions)
+    pivot_df = pivot_df.reindex(columns=desired_order + ["income"], fill_value=0)
 
     # Normalize by income for each year
     if as_percent:
         pivot_df[desired_order] = pivot_df[desired_order].div(pivot_df["income"], axis=0)
 
     # Handle missing or zero income to avoid division errors
-    pivot_df[desired_order] = pivot_df[desired_order].fillna(0)
+    pivot_df[desired_order] = pivot_df[desired_order].replace([np.inf, -np.inf], np.nan).fillna(0)
 
     # Define custom Minty theme-inspired colors
     minty_colors = ['#c2b2b4', '#78c2ad', '#5bc0be', '#8447ff', '#d972ff', '#ffb2e6']
@@ -0,0 +1,255 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt, timedelta
+from functools import partial
+import asyncio
+import time
+
+import pytz
+
+from dateutil.relativedelta import relativedelta
+
+from lib.utils import functions, writer
+from lib.utils.store import household_path
+
+# Monarch requests in flight at once
+MAX_CONCURRENT_REQUESTS = 3
+# Chunks being labelled and written at once
+MAX_CONCURRENT_UPLOADS = 2
+
+# Incremental sync re-reads this far behind the watermark, since Monarch
+# cannot be queried by updatedAt and recent transactions change most
+SYNC_LOOKBACK = timedelta(days=60)
+# Each sync also re-reads SWEEP_MONTHS older months, walking back to
+# SWEEP_START before wrapping, so edits to old transactions are picked up
+# within a bounded number of syncs (the Fetch range refreshes at once)
+SWEEP_START = dt(2020, 1, 1)
+SWEEP_MONTHS = 6
+
+
+def month_chunks(start_date, end_date):
+    """
+    Split an inclusive date range into calendar-month pieces.
+
+    Parameters
+    ----------
+    start_date : datetime
+        First day of the range.
+    end_date : datetime
+        Last day of the range.
+
+    Returns
+    -------
+    list[tuple]
+        ``(chunk_start, chunk_end)`` pairs, both inclusive, covering the
+        range without overlap.
+    """
+    chunks = []
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        next_month = (chunk_start + relativedelta(months=1)).replace(day=1)
+        chunk_end = min(next_month - timedelta(days=1), end_date)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = next_month
+    return chunks
+
+
+async def fetch_chunk(mm, chunk_start, chunk_end, semaphore):
+    """Download one chunk of transactions, waiting for a request slot first."""
+    async with semaphore:
+        result = await mm.get_transactions(
+            start_date=chunk_start.strftime("%Y-%m-%d"),
+            end_date=chunk_end.strftime("%Y-%m-%d"),
+            limit=None
+        )
+    return chunk_start, chunk_end, result["allTransactions"]["results"]
+
+
+def _upload_chunk(store, existing_transactions, records, chunk_start, chunk_end,
+                  config_json, uid, progress):
+    """Write a chunk's inserts and updates; return stats, written keys and deferred tombstones."""
+    upserts, deletes = functions.plan_transaction_updates(
+        store, existing_transactions, records, chunk_start, chunk_end,
+        config_json, uid=uid)
+    stats = store.write_transactions(upserts, progress=progress)
+    return stats, {(parent, str(record["id"])) for parent, record in upserts}, deletes
+
+
+async def fetch_and_update(mm, store, existing_transactions, start_date, end_date,
+                           config_json, uid, progress=writer.print_progress):
+    """Fetch and write an inclusive date range; see ``fetch_and_update_chunks``."""
+    return await fetch_and_update_chunks(
+        mm, store, existing_transactions, month_chunks(start_date, end_date),
+        config_json, uid, progress=progress)
+
+
+async def fetch_and_update_chunks(mm, store, existing_transactions, chunks,
+                                  config_json, uid, progress=writer.print_progress):
+    """
+    Fetch date ranges from Monarch and write each one as it arrives.
+
+    Chunks (normally months) are downloaded concurrently (at most ``MAX_CONCURRENT_REQUESTS``
+    at a time). As soon as a chunk arrives it is normalized, labelled,
+    diffed and its inserts and updates are written on a worker thread,
+    so downloads, processing and uploads overlap. Tombstones are written
+    last, skipping transactions that moved into another chunk, so a
+    removal can never overwrite a newer upsert.
+
+    Parameters
+    ----------
+    mm : MonarchMoney
+        Logged-in Monarch client.
+    store : TransactionStore
+        Store to write to.
+    existing_transactions : pd.DataFrame
+        Currently stored transactions.
+    chunks : list[tuple]
+        Non-overlapping inclusive ``(start, end)`` datetime ranges to
+        refresh, e.g. from ``month_chunks``.
+    config_json : str
+        JSON-serialized config.
+    uid : str
+        Firebase user id (the Flask session is not available on worker
+        threads).
+    progress : callable, optional
+        Progress callback passed to ``store.write_transactions``.
+
+    Returns
+    -------
+    dict
+        Combined write statistics in the shape returned by
+        ``store.write_transactions``, plus ``fetched``.
+    """
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    downloads = [
+        asyncio.create_task(fetch_chunk(mm, chunk_start, chunk_end, semaphore))
+        for chunk_start, chunk_end in chunks
+    ]
+
+    fetched = 0
+    uploads = []
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_UPLOADS,
+                            thread_name_prefix="upload") as executor:
+        for download in asyncio.as_completed(downloads):
+            chunk_start, chunk_end, records = await download
+            fetched += len(records)
+            print(f"{len(records)} transactions fetched for "
+                  f"{chunk_start:%Y-%m-%d} to {chunk_end:%Y-%m-%d}")
+            uploads.append(loop.run_in_executor(executor, partial(
+                _upload_chunk, store, existing_transactions, records,
+                chunk_start, chunk_end, config_json, uid, progress
+            )))
+        results = await asyncio.gather(*uploads)
+
+    # Write tombstones last, skipping documents another chunk re-wrote
+    written_keys = set().union(*(keys for stats, keys, deletes in results))
+    deletes = [
+        (parent, record)
+        for stats, keys, chunk_deletes in results
+        for parent, record in chunk_deletes
+        if (parent, str(record["id"])) not in written_keys
+    ]
+    results = [stats for stats, keys, chunk_deletes in results]
+    results.append(store.write_transactions(deletes, progress=progress))
+
+    seconds = time.perf_counter() - start
+    written = sum(stats["written"] for stats in results)
+    return {
+        "fetched": fetched,
+        "written": written,
+        "total": sum(stats["total"] for stats in results),
+        "seconds": seconds,
+        "docs_per_sec": written / seconds if seconds else 0,
+    }
+
+
+def sync_chunks(state, today):
+    """
+    Choose the chunks an incremental sync refreshes.
+
+    Parameters
+    ----------
+    state : dict
+        Stored ``monarch_sync`` state with ISO ``watermark`` and
+        ``sweep_cursor``, or empty before the first sync.
+    today : datetime
+        Last day to fetch (naive, midnight).
+
+    Returns
+    -------
+    list[tuple], datetime
+        Month chunks to fetch and the new sweep cursor.
+    """
+    watermark = state.get("watermark")
+    if watermark:
+        watermark = dt.fromisoformat(watermark).astimezone(pytz.UTC).replace(tzinfo=None)
+        recent_start = min(watermark, today) - SYNC_LOOKBACK
+    else:
+        recent_start = today - SYNC_LOOKBACK
+    recent_start = recent_start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    # Step the sweep back SWEEP_MONTHS from where it stopped, wrapping to
+    # just before the recent window once it reaches SWEEP_START
+    cursor = state.get("sweep_cursor")
+    cursor = dt.fromisoformat(cursor) if cursor else recent_start
+    if cursor <= SWEEP_START or cursor > recent_start:
+        cursor = recent_start
+    sweep_start = max(cursor - relativedelta(months=SWEEP_MONTHS), SWEEP_START).replace(day=1)
+
+    chunks = month_chunks(sweep_start, cursor - timedelta(days=1)) + month_chunks(recent_start, today)
+    return chunks, sweep_start
+
+
+async def sync_transactions(mm, store, existing_transactions, config_json, uid,
+                            progress=writer.print_progress):
+    """
+    Incrementally sync the household's transactions from Monarch.
+
+    Monarch cannot be queried by modification time, so the household's
+    ``monarch_sync`` watermark bounds the refresh instead: the months
+    since the last sync (less ``SYNC_LOOKBACK``) are re-read, plus
+    ``SWEEP_MONTHS`` older months chosen by a rotating sweep cursor. Only changed
+    transactions are written (see ``functions.diff_transactions``), and
+    the watermark advances once every chunk is stored.
+
+    Parameters
+    ----------
+    mm : MonarchMoney
+        Logged-in Monarch client.
+    store : TransactionStore
+        Store to write to.
+    existing_transactions : pd.DataFrame
+        Currently stored transactions.
+    config_json : str
+        JSON-serialized config.
+    uid : str
+        Firebase user id.
+    progress : callable, optional
+        Progress callback passed to ``store.write_transactions``.
+
+    Returns
+    -------
+    dict
+        Statistics from ``fetch_and_update_chunks``.
+    """
+    household_id, household_data = store.find_household(uid)
+    if not household_id:
+        raise ValueError("Error: User not assigned to a household")
+    state = household_data.get("monarch_sync", {})
+
+    synced_at = dt.now(pytz.UTC)
+    today = synced_at.replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    chunks, sweep_cursor = sync_chunks(state, today)
+    print(f"Syncing {len(chunks)} months to {today:%Y-%m-%d}, "
+          f"sweeping back to {sweep_cursor:%Y-%m}")
+
+    stats = await fetch_and_update_chunks(
+        mm, store, existing_transactions, chunks, config_json, uid, progress=progress)
+
+    store.update_document(household_path(household_id), {"monarch_sync": {
+        "watermark": synced_at.isoformat(),
+        "sweep_cursor": sweep_cursor.strftime("%Y-%m-%d"),
+    }})
+    return stats
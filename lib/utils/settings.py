@@ -0,0 +1,275 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+from lib.utils import budgets, cache
+from lib.utils.store import household_path, user_path
+
+# Settings copied from user and household documents into each config user
+SETTING_KEYS = {
+    "drop_cats": list,
+    "csp_from_group": dict,
+    "csp_from_category": dict,
+    "csp_labels": dict,
+    "cat_order": list,
+    "group_names": dict,
+    "cat_names": dict,
+    "accounts": list,
+}
+
+
+def load_config(store, uid):
+    """
+    Load the combined user and household config for a user and return its version.
+
+    Configs are cached per household (see ``cache.CONFIG_TTL``), so warm
+    page loads make no store reads. Only the version goes to the browser;
+    callbacks read what they need through the accessors below.
+
+    Parameters
+    ----------
+    store : TransactionStore
+        Store to read from on a cache miss.
+    uid : str
+        Signed-in user.
+
+    Returns
+    -------
+    str
+        Config version, held in ``config-store``.
+    """
+    household_id = cache.get_household(uid)
+    if household_id is not None:
+        version = cache.get_current_version(household_id)
+        if version is not None and cache.get_config(household_id, version) is not None:
+            return version
+
+    return _read_config(store, uid)[1]
+
+
+def _read_config(store, uid):
+    """Assemble a user's config from the store, cache it and return its household and version."""
+    # Find the household where the user is a member
+    household_id, household_data = store.find_household(uid)
+    if household_id is None:
+        raise ValueError("Error: User not assigned to a household")
+
+    config_json = json.dumps(build_config(store, household_id, household_data))
+    return household_id, cache.put_config(uid, household_id, config_json)
+
+
+def _authorize(store, uid, version):
+    """``authorize``, returning the household along with the version."""
+    if not uid:
+        raise ValueError("Error: User not found")
+    household_id = cache.get_household(uid)
+    if household_id is not None and version:
+        if cache.get_config(household_id, version) is not None:
+            return household_id, version
+        current = cache.get_config_alias(household_id, version)
+        if current is not None and cache.get_config(household_id, current) is not None:
+            return household_id, current
+
+    household_id, current = _read_config(store, uid)
+    if version:
+        cache.put_config_alias(household_id, version, current)
+    return household_id, current
+
+
+def authorize(store, uid, version):
+    """
+    Return a config version the user may read.
+
+    Versions come from the browser, so a version is only honoured if this
+    worker holds it for the user's household. Anything else (another
+    household's version, or one published by another worker or evicted)
+    is replaced by the version of a fresh read of the user's config, which
+    later lookups of the same version reuse. A version always names the
+    content it was cached with, so it is safe to key figures by.
+
+    Parameters
+    ----------
+    store : TransactionStore
+        Store to read from when the version is not honoured.
+    uid : str
+        Signed-in user.
+    version : str
+        Data of ``config-store`` or ``budget-version``.
+
+    Returns
+    -------
+    str
+    """
+    return _authorize(store, uid, version)[1]
+
+
+def get_config_json(store, uid, version):
+    """Return the config JSON for a version (see ``authorize``)."""
+    household_id, version = _authorize(store, uid, version)
+    return cache.get_config(household_id, version)
+
+
+def _projection(store, uid, version, name, build, *args):
+    """Memoize ``build(config, *args)`` per config version."""
+    household_id, version = _authorize(store, uid, version)
+    key = (household_id, version, name) + args
+    value = cache.get_projection(key)
+    if value is None:
+        value = cache.put_projection(key, build(get_config(store, uid, version), *args))
+    return value
+
+
+def get_config(store, uid, version):
+    """
+    Return the parsed config for a version, parsed once per worker.
+
+    The dict is shared between callbacks and must not be modified.
+    """
+    household_id, version = _authorize(store, uid, version)
+    key = (household_id, version, "config")
+    config = cache.get_projection(key)
+    if config is None:
+        config = cache.put_projection(key, json.loads(cache.get_config(household_id, version)))
+    return config
+
+
+def users(store, uid, version):
+    """Names of the config users, e.g. for the use-case dropdown."""
+    return _projection(store, uid, version, "users", lambda config: list(config["users"]))
+
+
+def user_config(store, uid, version, user):
+    """One user's settings and mappings, without budgets."""
+    return _projection(store, uid, version, "user", lambda config, user: {
+        key: value for key, value in config["users"][user].items() if key != "budget"
+    }, user)
+
+
+def budget_years(store, uid, version, user):
+    """Years with budgets for a user, as sorted strings."""
+    return [str(year) for year in budget_matrix(store, uid, version, user).years()]
+
+
+def budget_matrix(store, uid, version, user):
+    """A user's budgets as a ``BudgetMatrix``, built once per config version."""
+    return _projection(store, uid, version, "budget-matrix", lambda config, user:
+                       budgets.BudgetMatrix.from_config(config["users"][user]["budget"]), user)
+
+
+def apply_budget_changes(store, uid, version, user, changes):
+    """
+    Merge saved budget cells into a config and cache it under a new version.
+
+    Parameters
+    ----------
+    store : TransactionStore
+        Store to read from if the base version is not cached.
+    uid : str
+        Signed-in user.
+    version : str
+        Config version the changes were made against.
+    user : str
+        Config user whose budget changed.
+    changes : dict
+        ``{"YYYY-MM": {category: value}}``, as written to the store.
+
+    Returns
+    -------
+    str
+        Version of the patched config.
+    """
+    household_id, version = _authorize(store, uid, version)
+
+    # Patch a fresh copy; the parsed config of the old version is shared
+    config = json.loads(cache.get_config(household_id, version))
+    budget = config["users"][user]["budget"]
+    for doc_id, values in changes.items():
+        year, month = doc_id.split("-")
+        budget.setdefault(year, {}).setdefault(str(int(month)), {}).update(values)
+
+    new_version = cache.put_config(uid, household_id, json.dumps(config))
+
+    # Carry the budget matrix over rather than rebuilding it
+    cache.put_projection((household_id, new_version, "budget-matrix", user),
+                         budget_matrix(store, uid, version, user).with_changes(changes))
+    return new_version
+
+
+def _budgets_by_year(budget_docs):
+    """Nest ``{"YYYY-MM": values}`` as ``{"YYYY": {month: values}}``."""
+    budgets = {}
+    for doc_id, values in budget_docs.items():
+        year, month = doc_id.split("-")
+        budgets.setdefault(year, {})[int(month)] = values
+    return budgets
+
+
+def _user_config(uid, data, budgets):
+    return {
+        "uid": uid,
+        "budget": budgets,
+        **{key: data.get(key, default()) for key, default in SETTING_KEYS.items()},
+    }
+
+
+def build_config(store, household_id, household_data):
+    """
+    Assemble the config for a household.
+
+    Member documents are read in one batch while the household's and
+    every member's budget subcollections are read concurrently.
+
+    Parameters
+    ----------
+    store : TransactionStore
+        Store to read from.
+    household_id : str
+        Household id.
+    household_data : dict
+        Household document.
+
+    Returns
+    -------
+    dict
+    """
+    members = household_data.get("members", [])
+    parents = [household_path(household_id)] + [user_path(member) for member in members]
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        member_docs = pool.submit(store.get_documents, parents[1:])
+        budget_docs = store.read_budgets_many(parents)
+        member_docs = member_docs.result()
+
+    config = {
+        "users": {},
+        "group_names": {},
+        "cat_names": {},
+        "account_owner": {}
+    }
+
+    # Household (joint) budgets and settings; its accounts are owned by 'joint'
+    config["users"]["joint"] = _user_config(
+        "joint", household_data, _budgets_by_year(budget_docs[parents[0]]))
+    for acct in household_data.get("accounts", []):
+        config["account_owner"][acct] = "joint"
+
+    # Individual budgets and settings
+    for member_id, parent, user_data in zip(members, parents[1:], member_docs):
+        if user_data is None:
+            continue
+
+        username = user_data.get("name", member_id)
+
+        # Save group_names and cat_names once
+        if not config["group_names"]:
+            config["group_names"] = user_data.get("group_names", {})
+        if not config["cat_names"]:
+            config["cat_names"] = user_data.get("cat_names", {})
+
+        config["users"][username] = _user_config(
+            member_id, user_data, _budgets_by_year(budget_docs[parent]))
+
+        # User accounts → owner is username
+        for acct in user_data.get("accounts", []):
+            config["account_owner"][acct] = username
+
+    return config
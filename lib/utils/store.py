@@ -0,0 +1,498 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt, timedelta
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from lib.utils import writer
+
+# Backend used by the app; "firestore" or "sqlite"
+DEFAULT_STORE = "firestore"
+DEFAULT_SQLITE_PATH = os.path.join("data", "budgetbaby.db")
+
+# Transaction fields with their own SQLite column; anything else is kept as JSON
+TRANSACTION_COLUMNS = [
+    "date", "amount", "csp", "csp_label", "category_name", "account_name",
+    "plaidName", "notes", "content_hash", "updated_at", "deleted"
+]
+SQLITE_BATCH = 5000
+
+# Concurrent subcollection reads when assembling budgets for a household
+MAX_READ_THREADS = 8
+
+# Incremental reads re-read this window behind the high-water mark, since
+# Firestore server timestamps are assigned before the write is visible
+SYNC_OVERLAP = timedelta(minutes=1)
+
+# Timestamps are stored as UTC text so that string order is time order
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+UPDATED_AT_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    parent TEXT NOT NULL,
+    id TEXT NOT NULL,
+    date TEXT,
+    amount REAL,
+    csp TEXT,
+    csp_label TEXT,
+    category_name TEXT,
+    account_name TEXT,
+    plaidName TEXT,
+    notes TEXT,
+    content_hash TEXT,
+    updated_at TEXT,
+    deleted INTEGER,
+    extra TEXT,
+    PRIMARY KEY (parent, id)
+);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (parent, date);
+CREATE INDEX IF NOT EXISTS transactions_updated_at ON transactions (parent, updated_at);
+"""
+
+
+def user_path(uid):
+    """Document path of a user, the parent of their transactions and budgets."""
+    return f"users/{uid}"
+
+
+def household_path(household_id):
+    """Document path of a household, the parent of joint transactions and budgets."""
+    return f"households/{household_id}"
+
+
+def progress_path(uid):
+    """Document path of a user's fetch progress (see ``writer.store_progress``)."""
+    return f"{user_path(uid)}/status/fetch"
+
+
+class TransactionStore(ABC):
+    """
+    Persistence used by the app: user and household documents, monthly
+    budgets and transactions.
+
+    Documents are addressed by Firestore-style paths (``users/{uid}``,
+    ``households/{id}``). Transactions and budgets belong to a parent
+    document path. Transaction writes are upserts of whole records keyed
+    by ``id``; the store stamps each one with ``updated_at`` so that
+    ``sync.sync_collection`` can read changes incrementally. Removed
+    transactions are written as tombstones (``deleted: True``).
+    """
+
+    # How far behind the high-water mark incremental reads must start
+    sync_overlap = SYNC_OVERLAP
+
+    @abstractmethod
+    def find_household(self, uid):
+        """
+        Return ``(household_id, household_data)`` for the household the
+        user is a member of, or ``(None, None)``.
+        """
+
+    @abstractmethod
+    def get_document(self, path):
+        """Return a document's data, or None if it does not exist."""
+
+    def get_documents(self, paths):
+        """Return data for several documents (None where missing), in order."""
+        return [self.get_document(path) for path in paths]
+
+    @abstractmethod
+    def update_document(self, path, fields):
+        """Merge fields into a document, creating it if needed."""
+
+    @abstractmethod
+    def add_document(self, collection, data):
+        """Create a document with a generated id in a collection and return the id."""
+
+    @abstractmethod
+    def read_budgets(self, parent):
+        """Return ``{"YYYY-MM": {category: value}}`` for a parent document."""
+
+    def read_budgets_many(self, parents):
+        """Return ``{parent: read_budgets(parent)}``, reading parents concurrently."""
+        if not parents:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(MAX_READ_THREADS, len(parents))) as pool:
+            return dict(zip(parents, pool.map(self.read_budgets, parents)))
+
+    @abstractmethod
+    def write_budgets(self, parent, budgets):
+        """Replace monthly budget documents, given as ``{"YYYY-MM": {category: value}}``."""
+
+    @abstractmethod
+    def update_budgets(self, parent, changes):
+        """Merge changed cells, given as ``{"YYYY-MM": {category: value}}``, into budget documents."""
+
+    @abstractmethod
+    def read_transactions(self, parent, fields, since=None, start=None, end=None):
+        """
+        Read transactions under a parent document.
+
+        Parameters
+        ----------
+        parent : str
+            Parent document path.
+        fields : list[str]
+            Fields to read.
+        since : datetime, optional
+            Only read transactions with ``updated_at`` after this time.
+        start, end : datetime, optional
+            Only read transactions dated within this inclusive range.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per transaction with ``fields`` as columns, indexed
+            by transaction id. Missing fields are None.
+        """
+
+    @abstractmethod
+    def write_transactions(self, operations, progress=None):
+        """
+        Upsert transaction records.
+
+        Parameters
+        ----------
+        operations : list[tuple]
+            ``(parent, record)`` pairs. Each record carries its ``id``;
+            a transaction must appear at most once.
+        progress : callable, optional
+            Called as ``progress(written, total, docs_per_sec)``.
+
+        Returns
+        -------
+        dict
+            ``written``, ``total``, ``seconds`` and ``docs_per_sec``, as
+            returned by ``writer.bulk_write``.
+        """
+
+
+class FirestoreStore(TransactionStore):
+    """Store backed by Cloud Firestore."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def find_household(self, uid):
+        docs = (
+            self.db.collection("households")
+            .where("members", "array_contains", uid)
+            .limit(1)
+            .stream()
+        )
+        for doc in docs:
+            return doc.id, doc.to_dict()
+        return None, None
+
+    def get_document(self, path):
+        doc = self.db.document(path).get()
+        return doc.to_dict() if doc.exists else None
+
+    def get_documents(self, paths):
+        if not paths:
+            return []
+        # One batched round trip; snapshots come back in any order
+        snapshots = self.db.get_all([self.db.document(path) for path in paths])
+        found = {doc.reference.path: doc.to_dict() for doc in snapshots if doc.exists}
+        return [found.get(path) for path in paths]
+
+    def update_document(self, path, fields):
+        self.db.document(path).set(fields, merge=True)
+
+    def add_document(self, collection, data):
+        ref = self.db.collection(collection).document()
+        ref.set(data)
+        return ref.id
+
+    def read_budgets(self, parent):
+        return {
+            doc.id: doc.to_dict()
+            for doc in self.db.document(parent).collection("budgets").stream()
+        }
+
+    def write_budgets(self, parent, budgets):
+        budgets_ref = self.db.document(parent).collection("budgets")
+        writer.bulk_write(self.db, [
+            ("set", budgets_ref.document(doc_id), values)
+            for doc_id, values in budgets.items()
+        ])
+
+    def update_budgets(self, parent, changes):
+        budgets_ref = self.db.document(parent).collection("budgets")
+        writer.bulk_write(self.db, [
+            ("merge", budgets_ref.document(doc_id), values)
+            for doc_id, values in changes.items()
+        ])
+
+    def read_transactions(self, parent, fields, since=None, start=None, end=None):
+        query = self.db.document(parent).collection("transactions").select(fields)
+        if since is not None:
+            query = query.where("updated_at", ">", since)
+        if start is not None:
+            query = query.where("date", ">=", start)
+        if end is not None:
+            query = query.where("date", "<=", end)
+
+        # Fill column buffers directly rather than building a dict per row
+        ids = []
+        columns = {field: [] for field in fields}
+        for doc in query.stream():
+            values = doc.to_dict()
+            ids.append(doc.id)
+            for field, column in columns.items():
+                column.append(values.get(field))
+
+        return pd.DataFrame(columns, index=pd.Index(ids, dtype=object))
+
+    def write_transactions(self, operations, progress=None):
+        # Imported here so the SQLite backend runs without Firebase
+        from firebase_admin import firestore
+
+        return writer.bulk_write(self.db, [
+            ("set",
+             self.db.document(parent).collection("transactions").document(str(record["id"])),
+             {**record, "updated_at": firestore.SERVER_TIMESTAMP})
+            for parent, record in operations
+        ], progress=progress)
+
+
+def _to_utc_text(value, fmt):
+    if value is None or value is pd.NaT:
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(pytz.UTC)
+    return timestamp.tz_convert(pytz.UTC).strftime(fmt)
+
+
+def _to_sql(value):
+    """Convert a record value to something sqlite3 and json accept."""
+    if isinstance(value, (pd.Timestamp, dt)):
+        return _to_utc_text(value, DATE_FORMAT)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+class SQLiteStore(TransactionStore):
+    """
+    Store backed by a local SQLite file, for offline runs and load tests.
+
+    Transactions are indexed by ``(parent, date)`` and
+    ``(parent, updated_at)`` so date-range and incremental reads stay
+    cheap at millions of rows. Other documents are kept as JSON keyed by
+    path. Each thread uses its own connection. Writes take the database
+    lock before stamping ``updated_at``, so stamps follow commit order and
+    incremental reads need no overlap.
+    """
+
+    sync_overlap = timedelta(0)
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def find_household(self, uid):
+        row = self._connect().execute(
+            """
+            SELECT documents.path, documents.data
+            FROM documents, json_each(documents.data, '$.members')
+            WHERE documents.path LIKE 'households/%'
+              AND documents.path NOT LIKE 'households/%/%'
+              AND json_each.value = ?
+            LIMIT 1
+            """,
+            (uid,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        return row[0].split("/", 1)[1], json.loads(row[1])
+
+    def get_document(self, path):
+        row = self._connect().execute(
+            "SELECT data FROM documents WHERE path = ?", (path,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_documents(self, paths):
+        if not paths:
+            return []
+        placeholders = ", ".join("?" * len(paths))
+        rows = self._connect().execute(
+            f"SELECT path, data FROM documents WHERE path IN ({placeholders})", list(paths)
+        ).fetchall()
+        found = {path: json.loads(data) for path, data in rows}
+        return [found.get(path) for path in paths]
+
+    def update_document(self, path, fields):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT data FROM documents WHERE path = ?", (path,)).fetchone()
+            data = {**(json.loads(row[0]) if row else {}), **fields}
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (path, data) VALUES (?, ?)",
+                (path, json.dumps(data, default=_to_sql))
+            )
+
+    def add_document(self, collection, data):
+        doc_id = uuid.uuid4().hex[:20]
+        self.update_document(f"{collection}/{doc_id}", data)
+        return doc_id
+
+    def read_budgets(self, parent):
+        prefix = f"{parent}/budgets/"
+        rows = self._connect().execute(
+            "SELECT path, data FROM documents WHERE path >= ? AND path < ?",
+            (prefix, prefix + "\uffff")
+        ).fetchall()
+        return {path[len(prefix):]: json.loads(data) for path, data in rows}
+
+    def write_budgets(self, parent, budgets):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (path, data) VALUES (?, ?)",
+                [(f"{parent}/budgets/{doc_id}", json.dumps(values, default=_to_sql))
+                 for doc_id, values in budgets.items()]
+            )
+
+    def update_budgets(self, parent, changes):
+        if not changes:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            paths = [f"{parent}/budgets/{doc_id}" for doc_id in changes]
+            placeholders = ", ".join("?" * len(paths))
+            existing = dict(conn.execute(
+                f"SELECT path, data FROM documents WHERE path IN ({placeholders})", paths
+            ).fetchall())
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (path, data) VALUES (?, ?)",
+                [(path, json.dumps({**json.loads(existing.get(path, "{}")), **values},
+                                   default=_to_sql))
+                 for path, values in zip(paths, changes.values())]
+            )
+
+    def read_transactions(self, parent, fields, since=None, start=None, end=None):
+        selects = [
+            field if field in TRANSACTION_COLUMNS
+            else f"json_extract(extra, '$.{field}') AS \"{field}\""
+            for field in fields
+        ]
+        sql = f"SELECT id, {', '.join(selects)} FROM transactions WHERE parent = ?"
+        params = [parent]
+        if since is not None:
+            sql += " AND updated_at > ?"
+            params.append(_to_utc_text(since, UPDATED_AT_FORMAT))
+        if start is not None:
+            sql += " AND date >= ?"
+            params.append(_to_utc_text(start, DATE_FORMAT))
+        if end is not None:
+            sql += " AND date <= ?"
+            params.append(_to_utc_text(end, DATE_FORMAT))
+
+        frame = pd.read_sql_query(sql, self._connect(), params=params, index_col="id")
+        frame.index = frame.index.astype(object)
+        return frame
+
+    def write_transactions(self, operations, progress=None):
+        total = len(operations)
+        written = 0
+        start = time.perf_counter()
+
+        placeholders = ", ".join("?" * (len(TRANSACTION_COLUMNS) + 3))
+        sql = (
+            f"INSERT OR REPLACE INTO transactions "
+            f"(parent, id, {', '.join(TRANSACTION_COLUMNS)}, extra) VALUES ({placeholders})"
+        )
+
+        conn = self._connect()
+        for batch_operations in writer.chunk(operations, SQLITE_BATCH):
+            rows = []
+            for parent, record in batch_operations:
+                record = {key: _to_sql(value) for key, value in record.items()}
+                extra = {
+                    key: value for key, value in record.items()
+                    if key != "id" and key not in TRANSACTION_COLUMNS
+                }
+                rows.append(
+                    [parent, str(record["id"])]
+                    + [record.get(column) for column in TRANSACTION_COLUMNS]
+                    + [json.dumps(extra) if extra else None]
+                )
+            updated_at_index = 2 + TRANSACTION_COLUMNS.index("updated_at")
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                updated_at = dt.now(pytz.UTC).strftime(UPDATED_AT_FORMAT)
+                for row in rows:
+                    row[updated_at_index] = updated_at
+                conn.executemany(sql, rows)
+            written += len(rows)
+            elapsed = time.perf_counter() - start
+            if progress is not None:
+                progress(written, total, written / elapsed if elapsed else 0)
+
+        seconds = time.perf_counter() - start
+        return {
+            "written": written,
+            "total": total,
+            "seconds": seconds,
+            "docs_per_sec": written / seconds if seconds else 0,
+        }
+
+
+def open_store(kind=None, db=None, path=None):
+    """
+    Create the configured store.
+
+    Parameters
+    ----------
+    kind : str, optional
+        ``"firestore"`` or ``"sqlite"``; defaults to the
+        ``TRANSACTION_STORE`` environment variable, then ``DEFAULT_STORE``.
+    db : google.cloud.firestore.Client, optional
+        Firestore client, required for the Firestore backend.
+    path : str, optional
+        SQLite file; defaults to ``TRANSACTION_STORE_PATH``, then
+        ``DEFAULT_SQLITE_PATH``.
+
+    Returns
+    -------
+    TransactionStore
+    """
+    kind = kind or os.environ.get("TRANSACTION_STORE", DEFAULT_STORE)
+    if kind == "firestore":
+        if db is None:
+            raise ValueError("A Firestore client is required for the firestore store")
+        return FirestoreStore(db)
+    if kind == "sqlite":
+        return SQLiteStore(path or os.environ.get("TRANSACTION_STORE_PATH", DEFAULT_SQLITE_PATH))
+    raise ValueError(f"Unknown transaction store: {kind}")
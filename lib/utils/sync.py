@@ -0,0 +1,270 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt
+import hashlib
+import threading
+import pandas as pd
+import pytz
+
+from lib.utils import cache, cube
+from lib.utils.store import household_path, user_path
+
+# Columns read by the dashboards; everything else stays in the store
+TRANSACTION_FIELDS = [
+    "date", "amount", "csp", "csp_label", "category_name", "account_name",
+    "plaidName", "notes"
+]
+SYNC_FIELDS = TRANSACTION_FIELDS + ["content_hash", "updated_at", "deleted"]
+
+# household_id -> parent path -> {"rows", "high_water_mark", "frame", "cube"}
+_snapshots = {}
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sync")
+
+
+def _pull(store, parent, since=None):
+    """
+    Read projected transactions under a parent document.
+
+    Only ``SYNC_FIELDS`` are requested. When ``since`` is given, only
+    documents updated after it (less the store's ``sync_overlap``, so
+    writes that commit while a sync is in flight are not skipped) are
+    read. Merging is idempotent.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per document, indexed by document id.
+    """
+    if since is not None:
+        since = since - store.sync_overlap
+    return store.read_transactions(parent, SYNC_FIELDS, since=since)
+
+
+def _concat(frames):
+    """Concatenate frames, skipping empty ones (pandas warns on them) but keeping the columns."""
+    non_empty = [frame for frame in frames if not frame.empty]
+    if not non_empty:
+        return frames[-1]
+    if len(non_empty) == 1:
+        return non_empty[0]
+    return pd.concat(non_empty)
+
+
+def _build_frame(rows, owner_name):
+    frame = rows.drop(columns=["updated_at", "deleted"])
+    frame.insert(0, "id", frame.index)
+    frame = frame.reset_index(drop=True)
+    frame["date"] = pd.to_datetime(frame["date"], utc=True)
+    frame["account_owner"] = owner_name
+    return frame
+
+
+def sync_collection(store, household_id, parent, owner_name):
+    """
+    Bring the server-side snapshot of one transactions collection up to date.
+
+    The first call for a collection pulls every document. Later calls only
+    query documents whose ``updated_at`` is past the stored high-water mark
+    and merge them into the snapshot; tombstones (``deleted: True``) drop
+    the document. The snapshot's monthly cube is updated from the same
+    delta rather than rebuilt.
+
+    Parameters
+    ----------
+    store : TransactionStore
+        Store to read from.
+    household_id : str
+        Household the collection belongs to.
+    parent : str
+        Path of the user or household document owning the transactions.
+    owner_name : str
+        Value assigned to ``account_owner`` for every row. Snapshots are
+        keyed by ``parent``, since member names need not be unique.
+
+    Returns
+    -------
+    pd.DataFrame, pd.DataFrame
+        Current transactions in the collection and their monthly cube
+        (see ``cube.build_cube``).
+    """
+    with _lock:
+        snapshot = _snapshots.setdefault(household_id, {}).get(parent)
+
+    if snapshot is None:
+        changes = _pull(store, parent)
+        print(f"Cold sync of {owner_name} transactions: {len(changes)} documents")
+        rows = changes.iloc[0:0]
+        high_water_mark = None
+        frame = None
+        monthly = None
+    else:
+        changes = _pull(store, parent, since=snapshot["high_water_mark"])
+        rows = snapshot["rows"]
+        high_water_mark = snapshot["high_water_mark"]
+        frame = snapshot["frame"]
+        monthly = snapshot["cube"]
+
+    if not changes.empty:
+        updated_at = pd.to_datetime(changes["updated_at"], utc=True).max()
+        if pd.notna(updated_at) and (high_water_mark is None or updated_at > high_water_mark):
+            high_water_mark = updated_at
+
+        # Snapshots are replaced, never mutated, so concurrent readers stay consistent
+        deleted = changes["deleted"].eq(True)
+        previous = rows.loc[rows.index.intersection(changes.index)]
+        rows = _concat([
+            rows.drop(index=changes.index, errors="ignore"),
+            changes.loc[~deleted]
+        ])
+        if monthly is not None:
+            monthly = cube.update_cube(monthly,
+                                       _build_frame(previous, owner_name),
+                                       _build_frame(changes.loc[~deleted], owner_name))
+
+    # Legacy documents carry no updated_at; start watching from now
+    if high_water_mark is None:
+        high_water_mark = dt.now(pytz.UTC)
+
+    if not changes.empty or frame is None:
+        frame = _build_frame(rows, owner_name)
+    if monthly is None:
+        monthly = cube.build_cube(frame)
+
+    snapshot = {"rows": rows, "high_water_mark": high_water_mark,
+                "frame": frame, "cube": monthly}
+    with _lock:
+        _snapshots.setdefault(household_id, {})[parent] = snapshot
+
+    return frame, monthly
+
+
+def data_version(household_id, parents):
+    """Short token identifying the current state of the given collections' snapshots."""
+    with _lock:
+        snapshots = _snapshots.get(household_id, {})
+        state = "|".join(
+            f"{parent}:{snapshots[parent]['high_water_mark'].isoformat()}:{len(snapshots[parent]['rows'])}"
+            for parent in sorted(parents)
+        )
+    return hashlib.sha1(state.encode()).hexdigest()[:12]
+
+
+def combine(frames):
+    """
+    Concatenate per-owner frames sorted by date, skipping empty ones but
+    keeping the columns.
+    """
+    non_empty = [frame for frame in frames if not frame.empty]
+    if not non_empty:
+        return frames[0]
+    return pd.concat(non_empty, ignore_index=True).sort_values(
+        "date", kind="stable", ignore_index=True)
+
+
+def load_transactions(store, uid):
+    """
+    Sync the user's and household's transactions and cache the result.
+
+    The household lookup and user document are read together, then the
+    personal and household collections are synced concurrently.
+
+    Parameters
+    ----------
+    store : TransactionStore
+        Store to read from.
+    uid : str
+        Firebase user id of the signed-in user.
+
+    Returns
+    -------
+    dict
+        Handle for ``transaction-data-store`` (see ``cache.put_transactions``).
+    """
+    if not uid:
+        raise ValueError("Error: User not found")
+
+    # Find household where user is a member
+    household_future = _executor.submit(store.find_household, uid)
+    user_future = _executor.submit(store.get_document, user_path(uid))
+
+    household_id, _ = household_future.result()
+    if not household_id:
+        raise ValueError("Error: User not assigned to a household")
+
+    user_data = user_future.result()
+    user_name = user_data.get("name", "user") if user_data else "user"
+
+    # Only documents changed since the last load are read from the store
+    futures = [
+        _executor.submit(sync_collection, store, household_id, user_path(uid), user_name),
+        _executor.submit(sync_collection, store, household_id, household_path(household_id), "joint"),
+    ]
+    frames, cubes = zip(*(future.result() for future in futures))
+
+    version = data_version(household_id, [user_path(uid), household_path(household_id)])
+    handle = {"household_id": household_id, "version": version}
+    if cache.get_transactions(handle) is None:
+        transactions = combine(frames)
+        handle = cache.put_transactions(household_id, version, transactions,
+                                        cube.combine_cubes(cubes),
+                                        cube.build_daily_index(transactions), uid=uid)
+    return handle
+
+
+def authorize(store, uid, handle):
+    """
+    Return a ``transaction-data-store`` handle the user may read.
+
+    Handles come from the browser, so a handle is only honoured if this
+    worker issued it to ``uid``. Anything else (another user's or
+    household's handle, or one minted by another worker) is replaced by
+    the user's own handle from an incremental sync.
+    """
+    if not uid:
+        raise ValueError("Error: User not found")
+    if handle and cache.get_transactions_uid(handle) == uid:
+        return handle
+    return load_transactions(store, uid)
+
+
+def _resolve(store, uid, handle, get):
+    handle = authorize(store, uid, handle)
+    value = get(handle)
+    if value is None:
+        value = get(load_transactions(store, uid))
+    return value
+
+
+def resolve_transactions(store, uid, handle):
+    """
+    Return the transactions frame for a ``transaction-data-store`` handle.
+
+    Handles not issued to ``uid`` by this worker (see ``authorize``) are
+    resolved by an incremental sync, which is a handful of reads.
+    """
+    return _resolve(store, uid, handle, cache.get_transactions)
+
+
+def resolve_cube(store, uid, handle):
+    """Return the monthly cube for a ``transaction-data-store`` handle."""
+    return _resolve(store, uid, handle, cache.get_cube)
+
+
+def resolve_daily_index(store, uid, handle):
+    """Return the daily prefix-sum index for a ``transaction-data-store`` handle."""
+    return _resolve(store, uid, handle, cache.get_daily_index)
+
+
+def invalidate(household_id=None):
+    """
+    Drop the snapshot for a household (or all households) to force a full pull.
+
+    Not called by the app, which relies on new data versions superseding
+    cached entries; used to time cold syncs (``scripts/benchmark_store.py``).
+    """
+    with _lock:
+        if household_id is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(household_id, None)
+    cache.invalidate_transactions(household_id)
@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import random
+import threading
+import time
+
+# Firestore rejects batches with more than 500 writes
+BATCH_LIMIT = 500
+MAX_WORKERS = 4
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # seconds
+
+# Minimum seconds between progress updates published for the UI
+PROGRESS_INTERVAL = 1.0
+
+
+def transient_errors():
+    """Firestore errors worth retrying."""
+    # Imported here so the SQLite backend runs without the Google SDK
+    from google.api_core import exceptions as gexc
+
+    return (
+        gexc.Aborted,
+        gexc.DeadlineExceeded,
+        gexc.InternalServerError,
+        gexc.ResourceExhausted,
+        gexc.ServiceUnavailable,
+    )
+
+
+def chunk(operations, size=BATCH_LIMIT):
+    """Split a list of operations into lists of at most ``size`` items."""
+    return [operations[i:i + size] for i in range(0, len(operations), size)]
+
+
+def _commit(db, operations, max_retries):
+    """Commit one chunk as a batch, retrying transient errors with exponential backoff."""
+    retryable = transient_errors()
+    for attempt in range(max_retries + 1):
+        batch = db.batch()
+        for op, ref, data in operations:
+            if op == "delete":
+                batch.delete(ref)
+            elif op == "merge":
+                batch.set(ref, data, merge=True)
+            else:
+                batch.set(ref, data)
+        try:
+            batch.commit()
+            return len(operations)
+        except retryable as e:
+            if attempt == max_retries:
+                raise
+            delay = BACKOFF_BASE * 2 ** attempt * (1 + random.random())
+            print(f"Batch commit failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def bulk_write(db, operations, max_workers=MAX_WORKERS, max_retries=MAX_RETRIES,
+               progress=None):
+    """
+    Commit many Firestore writes in concurrent, size-limited batches.
+
+    Parameters
+    ----------
+    db : google.cloud.firestore.Client
+        Firestore client.
+    operations : list[tuple]
+        ``("set", doc_ref, data)``, ``("merge", doc_ref, data)`` or
+        ``("delete", doc_ref, None)`` tuples.
+        A document must appear at most once, since chunks commit in no
+        particular order.
+    max_workers : int
+        Maximum number of batches in flight.
+    max_retries : int
+        Retries per batch for transient errors.
+    progress : callable, optional
+        Called as ``progress(written, total, docs_per_sec)`` after each
+        batch commits.
+
+    Returns
+    -------
+    dict
+        ``written``, ``total``, ``seconds`` and ``docs_per_sec``.
+    """
+    total = len(operations)
+    written = 0
+    start = time.perf_counter()
+
+    if total:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="writer") as executor:
+            futures = [
+                executor.submit(_commit, db, batch_operations, max_retries)
+                for batch_operations in chunk(operations)
+            ]
+            for future in as_completed(futures):
+                written += future.result()
+                elapsed = time.perf_counter() - start
+                if progress is not None:
+                    progress(written, total, written / elapsed if elapsed else 0)
+
+    seconds = time.perf_counter() - start
+    return {
+        "written": written,
+        "total": total,
+        "seconds": seconds,
+        "docs_per_sec": written / seconds if seconds else 0,
+    }
+
+
+def format_progress(written, total, docs_per_sec):
+    """One-line progress message for a write in flight."""
+    return f"Committed {written:,}/{total:,} writes ({docs_per_sec:,.0f} docs/sec)"
+
+
+def print_progress(written, total, docs_per_sec):
+    print(format_progress(written, total, docs_per_sec))
+
+
+def store_progress(store, path, interval=PROGRESS_INTERVAL):
+    """
+    Progress callback that also publishes progress to a store document.
+
+    The message is merged into the document as ``message``, at most once
+    per ``interval`` seconds and always when a write completes, so a
+    page can poll it while a long fetch runs (e.g. from another worker).
+
+    Parameters
+    ----------
+    store : TransactionStore
+        Store to publish to.
+    path : str
+        Document path, e.g. from ``store.progress_path``.
+    interval : float
+        Minimum seconds between published updates.
+
+    Returns
+    -------
+    callable
+        ``progress(written, total, docs_per_sec)``.
+    """
+    lock = threading.Lock()
+    last = [0.0]
+
+    def progress(written, total, docs_per_sec):
+        print_progress(written, total, docs_per_sec)
+        now = time.monotonic()
+        with lock:
+            if written < total and now - last[0] < interval:
+                return
+            last[0] = now
+        store.update_document(path, {"message": format_progress(written, total, docs_per_sec)})
+
+    return progress
+
+
+def format_summary(stats):
+    """One-line summary of ``bulk_write`` results for the UI."""
+    if not stats["total"]:
+        return "Transactions are already up to date."
+    return (
+        f"Saved {stats['written']:,} changes in {stats['seconds']:.1f}s "
+        f"({stats['docs_per_sec']:,.0f} docs/sec)."
+    )
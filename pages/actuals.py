@@ -1,16 +1,13 @@
 import dash
-from dash import html, dcc, callback, Input, Output, State, ctx
+from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Input, Output, State
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
+import dash_ag_grid as dag
 from datetime import datetime as dt
 from flask import session
-import json
-import pandas as pd
-from io import StringIO
-from dateutil.relativedelta import relativedelta
 
-from firebase import db
-from lib.utils import functions
+from firebase import store
+from lib.utils import cache, drilldown, functions, settings, sync
 
 dash.register_page(__name__, path='/')
 
@@ -44,6 +41,20 @@ forward_year = dbc.Button(
 )
 
 
+transaction_grid = dag.AgGrid(
+    id='transaction-grid',
+    columnDefs=drilldown.column_defs(),
+    defaultColDef={"sortable": True, "resizable": True, "flex": 1},
+    rowModelType="infinite",
+    style={"height": "60vh", "width": "100%"},
+    dashGridOptions={
+        "cacheBlockSize": drilldown.PAGE_SIZE,
+        "maxBlocksInCache": 10,
+        "infiniteInitialRowCount": 0,
+    },
+)
+
+
 uploader = dcc.Upload(
     id='upload-transactions',
     children=html.Div([
@@ -106,7 +117,15 @@ layout = html.Div([
                                 type="circle",
                                 children=html.Div(
                                     id='budget-chart-container',
-                                    children=html.P("Loading transactions...")
+                                    children=[
+                                        html.P("Loading transactions...",
+                                               id='budget-chart-message'),
+                                        dcc.Graph(
+                                            id='budget-chart',
+                                            config={'displayModeBar': False},
+                                            style={'display': 'none'}
+                                        )
+                                    ]
                                 )
                             )
                         ),
@@ -118,9 +137,16 @@ layout = html.Div([
             # Third Row: Transaction Table
             dbc.Row(
                 dbc.Col(
-                    dbc.Container(id='transaction_table', className="pt-3")
+                    dbc.Container(
+                        transaction_grid,
+                        id='transaction_table',
+                        className="pt-3",
+                        style={'display': 'none'}
+                    )
                 )
-            )
+            ),
+            dcc.Store(id='drilldown-query'),
+            dcc.Store(id='budget-chart-categories')
         ]
     )
 ])
@@ -130,62 +156,31 @@ layout = html.Div([
     Output('transaction-data-store', 'data'),
     Input('config-store', 'data')
 )
-def upload_transactions(config_json):
+def upload_transactions(config_version):
     """
-    Store user + household transactions in browser memory at page load.
+    Load user + household transactions into the server-side cache.
+
+    Transactions are kept in a server-side snapshot per household; after
+    the first (full) load only documents updated since the last sync are
+    read from Firestore. The browser only receives a small handle.
 
     Parameters
     ----------
-    config_json : str
-        JSON-serialized configuration file for the user (already loaded separately).
+    config_version : str
+        Version of the user's config (already loaded separately).
 
     Returns
     -------
-    str
-        JSON-serialized Pandas DataFrame containing all transactions.
+    dict
+        Handle (household id and data version) resolving to the cached
+        transactions DataFrame.
     """
-    uid = session.get("user_id")
-    if not uid:
-        raise ValueError("Error: User not found")
-
-    # Find household where user is a member
-    household_query = (
-        db.collection("households")
-        .where("members", "array_contains", uid)
-        .limit(1)
-        .stream()
-    )
-    household_doc = next(household_query, None)
-    if not household_doc:
-        raise ValueError("Error: User not assigned to a household")
+    return sync.load_transactions(store, session.get("user_id"))
 
-    household_id = household_doc.id
 
-    all_txns = []
-
-    # Helper to fetch and label transactions
-    def fetch_transactions(collection_ref, owner_name):
-        for txn_doc in collection_ref.stream():
-            txn = txn_doc.to_dict()
-            txn["account_owner"] = owner_name
-            all_txns.append(txn)
-
-    # Personal transactions
-    user_doc = db.collection("users").document(uid).get()
-    user_name = user_doc.to_dict().get("name", "user") if user_doc.exists else "user"
-    fetch_transactions(db.collection("users").document(uid).collection("transactions"), user_name)
-
-    # Household transactions
-    fetch_transactions(db.collection("households").document(household_id).collection("transactions"), "joint")
-
-    # Return empty DataFrame if no transactions
-    if not all_txns:
-        return pd.DataFrame().to_json(date_format="iso", orient="split")
-
-    return pd.DataFrame(all_txns).to_json(date_format="iso", orient="split")
-
-
-@callback(
+# Step the date range back or forward (assets/callbacks.js)
+clientside_callback(
+    ClientsideFunction(namespace='budgetbaby', function_name='adjust_date_range'),
     Output("date-picker-range", "start_date"),
     Output("date-picker-range", "end_date"),
     Input("back-year", "n_clicks"),
@@ -195,154 +190,110 @@ def upload_transactions(config_json):
     State("date-picker-range", "min_date_allowed"),
     State("date-picker-range", "max_date_allowed"),
 )
-def adjust_date_range(back_clicks, forward_clicks, start_date, end_date, 
-                      min_date_allowed, max_date_allowed):
-    """
-	Updates date range of the date picker.
-	
-	User can select dates directly or use back and forward buttons to 
-    jump by month (if single month selected) or year (if more than one
-    month selected).
-	
-	Parameters
-	----------
-    back_clicks: int
-        Number of clicks of back element
-    forward_clicks: int
-        Number of clicks of forward element
-    start_date: str
-        Start date selected (or current selection)
-    end_date: str
-        End date selected (or current end date)
-    min_date_allowed: str
-        Min date allowed on date picker element, if set
-	max_date_allowed: str
-        Max date allowed on date picker element, if set
-	Returns
-	-------
-	Str
-	    New start date
-    Str
-        New end date
-	"""
-    # Determine which button was clicked
-    trigger = ctx.triggered_id
-    if not trigger:
-        raise PreventUpdate
-    
-    # Convert dates from strings to datetime objects
-    start_date = dt.fromisoformat(start_date)
-    end_date = dt.fromisoformat(end_date)
-    min_date_allowed = dt.fromisoformat(min_date_allowed) if min_date_allowed else None
-    max_date_allowed = dt.fromisoformat(max_date_allowed) if max_date_allowed else None
-
-    def get_last_day_of_month(date):
-        """Return the last day of the month for the given date."""
-        next_month = date + relativedelta(months=1)
-        return next_month.replace(day=1) - relativedelta(days=1)
-    
-    # Delta is one month if same month currently selected, else one year
-    if (start_date.year == end_date.year) & (start_date.month == end_date.month):
-        time_delta = relativedelta(months=1)
-    else:
-        time_delta = relativedelta(years=1)
-
-    # Handle the back-year button
-    if trigger == "back-year":
-        # Prevent update if the current start_date is equal to or earlier than the min_date_allowed
-        if min_date_allowed and start_date <= min_date_allowed:
-            raise PreventUpdate
-        # Calculate new dates
-        new_start_date = start_date - time_delta
-        new_end_date = end_date - time_delta
-
-    # Handle the forward-year button
-    elif trigger == "forward-year":
-        # Prevent update if the current end_date is equal to or later than the max_date_allowed
-        if max_date_allowed and end_date >= max_date_allowed:
-            raise PreventUpdate
-        # Calculate new dates
-        new_start_date = start_date + time_delta
-        new_end_date = end_date + time_delta
-
-    else:
-        raise PreventUpdate
-
-    # Adjust the end_date to the last day of the new month if in the same month
-    if new_start_date.year == new_end_date.year and new_start_date.month == new_end_date.month:
-        new_end_date = get_last_day_of_month(new_end_date)
-
-    # Clamp to min_date_allowed and max_date_allowed
-    if min_date_allowed:
-        new_start_date = max(new_start_date, min_date_allowed)
-        new_end_date = max(new_end_date, min_date_allowed)
-    if max_date_allowed:
-        new_start_date = min(new_start_date, max_date_allowed)
-        new_end_date = min(new_end_date, max_date_allowed)
-
-    # Convert dates back to strings for the DatePicker component
-    return new_start_date.isoformat(), new_end_date.isoformat()
 
 
 @callback(
-    Output('budget-chart-container', 'children'),
+    [Output('budget-chart', 'figure'),
+     Output('budget-chart', 'style'),
+     Output('budget-chart-message', 'children'),
+     Output('budget-chart-categories', 'data')],
     [Input('transaction-data-store', 'data'),
      Input('date-picker-range', 'start_date'),
      Input('date-picker-range', 'end_date'),
-     Input('use-case', 'value')],
-    [State('config-store', 'data')])
-def update_plot(transactions_data, start_date, end_date, user, config):
+     Input('use-case', 'value'),
+     Input('budget-version', 'data')],
+    [State('config-store', 'data'),
+     State('budget-chart-categories', 'data')])
+def update_plot(transactions_data, start_date, end_date, user, budget_version,
+                config_version, chart_categories):
     """
 	Create or update budget chart.
 	
+	Reports and figures are cached per (owner, dates, transactions
+	version, config version). When the report has the same categories as
+	the chart on screen, only the bar values and label texts are sent as
+	a Patch; otherwise the whole figure is sent.
+	
 	Parameters
 	----------
-    transaction_data: str
-        JSON-serialized transaction data
+    transaction_data: dict
+        Handle for the cached transaction data
     start_date: str
         Start date from date picker
     end_date: str
         End date from date picker
-    config: str
-        JSON-serialized configuration file for the user
+    config_version: str
+        Version of the user's config
     user: str
         User name from select filter
+    budget_version: str
+        Version published by the last budget save, if any
+    chart_categories: list
+        Categories of the chart on screen, if any
 	
 	Returns
 	-------
-	Plotly.Figure
+	Plotly.Figure or dash.Patch
 	    Budget chart
-    None
-        Resets the clickData property of the budget chart
+    dict
+        Style showing or hiding the chart
+    str
+        Message shown instead of the chart
+    list
+        Categories of the new chart
 	"""    
-    # Read config
-    config = json.loads(config)
+    # Only serve cached data and config issued to this user; config
+    # includes any budget saved since the page loaded
+    uid = session.get("user_id")
+    transactions_data = sync.authorize(store, uid, transactions_data)
+    version = settings.authorize(store, uid, budget_version or config_version)
+
+    # Reuse the report and figure if this view was already drawn today
+    key = cache.figure_key('budget-chart', transactions_data, user, start_date,
+                           end_date, version, dt.today().date())
+    chart = cache.get_figure(key)
+    if chart is None:
+        chart = cache.put_figure(key, build_chart(
+            transactions_data, start_date, end_date, user, version))
+    budget_report = chart["report"]
+
+    if budget_report is None:
+        return dash.no_update, {'display': 'none'}, "No transactions found.", None
     
+    # Patch the chart in place if the categories are unchanged
+    categories = budget_report['category'].tolist()
+    if categories == chart_categories:
+        fig = functions.patch_report(budget_report, dt.fromisoformat(start_date),
+                                     dt.fromisoformat(end_date))
+        return fig, {'display': 'block'}, None, dash.no_update
+
+    return chart["figure"], {'display': 'block'}, None, categories
+
+
+def build_chart(transactions_data, start_date, end_date, user, version):
+    """Budget report and figure for a view (report is None if no transactions)."""
     # Parse dates from calendar
     start_date = dt.fromisoformat(start_date)
     end_date = dt.fromisoformat(end_date)
     
-    # Read budget
-    budget = functions.read_budget(config, user)
+    # Read config and budget
+    uid = session.get("user_id")
+    config = settings.get_config(store, uid, version)
+    budget = settings.budget_matrix(store, uid, version, user)
     
-    # Read transactions
-    transactions = pd.read_json(StringIO(transactions_data), orient='split')
+    # Read transactions and their daily prefix sums
+    transactions = sync.resolve_transactions(store, uid, transactions_data)
+    daily_index = sync.resolve_daily_index(store, uid, transactions_data)
     
     # Create budget report
     budget_report = functions.build_budget_report(
-        transactions, budget, start_date, end_date, config, user)
+        transactions, budget, start_date, end_date, config, user, daily_index)
     
     if budget_report['amount'].abs().sum() == 0:
-        return html.P("No transactions found.")
-    
-    # Update chart
-    fig = functions.plot_report(budget_report, start_date, end_date)
+        return {"report": None, "figure": None}
 
-    return dcc.Graph(
-        id='budget-chart',
-        figure=fig,
-        config={'displayModeBar': False}
-    )
+    fig = functions.plot_report(budget_report, start_date, end_date)
+    return {"report": budget_report, "figure": fig}
 
 
 @callback(
@@ -354,76 +305,89 @@ def clear_clickdata_on_update(fig):
     return None
 
 @callback(
-    Output('transaction_table', 'children'),
+    [Output('drilldown-query', 'data'),
+     Output('transaction_table', 'style')],
     [Input('budget-chart', 'clickData')],
-    [State('transaction-data-store', 'data'),
-     State('date-picker-range', 'start_date'),
+    [State('date-picker-range', 'start_date'),
      State('date-picker-range', 'end_date'),
      State('use-case', 'value')]
 )
-def update_table(clickData, transactions_data, start_date, end_date,
-                 user):
+def update_table(clickData, start_date, end_date, user):
     """
 	Show transactions table for clicked transaction category.
 	
+	Rows are not sent here: the grid pages through them with
+	``get_transaction_rows``.
+	
 	Parameters
 	----------
     clickData: str
         name of the category clicked in the budget chart
-    transaction_data: str
-        JSON-serialized transaction data
     start_date: str
         Start date from date picker
     end_date: str
         End date from date picker
+    user: str
+        User name from select filter
 	
 	Returns
 	-------
-	dashBootstrapComponents.Table
-	    Prettified table of transactions corresponding to clicked 
-        category
+	dict
+	    Drill-down query for the grid
+    dict
+        Style showing or hiding the table
 	"""
     if clickData is None:
-        return html.Div()
-    else:
-        category = clickData['points'][0]['y']
-        transactions = pd.read_json(StringIO(transactions_data), orient='split')
-        
-        if category == 'Total Spending':
-            filt = (
-                (transactions['date'] >= start_date) &
-                (transactions['date'] <= end_date) &
-                (transactions['account_owner'] == user) &
-                (transactions['csp_label'] != 'income')
-            )
-        elif category == 'Total Income':
-            filt = (
-                (transactions['date'] >= start_date) &
-                (transactions['date'] <= end_date) &
-                (transactions['account_owner'] == user) &
-                (transactions['csp_label'] == 'income')
-            )
-        else:
-            filt = (
-                (transactions['date'] >= start_date) &
-                (transactions['date'] <= end_date) & 
-                (transactions['account_owner'] == user) &
-                (transactions['csp'] == category)
-            )
-        transactions = transactions.loc[filt]
-        
-        # format table
-        table_style = {
-            "color": "darkgrey",  # Set text color to dark grey
-            "font-family": "inherit",  # Use the default font of the Dash app
-        }
-                
-        pretty_transactions = functions.format_table(transactions)
-        transaction_table = dbc.Table.from_dataframe(pretty_transactions,
-                                                     striped=True,
-                                                     bordered=True,
-                                                     hover=True,
-                                                     responsive=True,
-                                                     style=table_style)
-        
-        return transaction_table
\ No newline at end of file
+        return None, {'display': 'none'}
+
+    category = clickData['points'][0]['y']
+    query = drilldown.make_query(category, start_date, end_date, user)
+    return query, {'display': 'block'}
+
+
+# Refetch from the first row whenever the drill-down changes (assets/callbacks.js)
+clientside_callback(
+    ClientsideFunction(namespace='budgetbaby', function_name='refresh_drilldown'),
+    Output('transaction-grid', 'scrollTo'),
+    Input('drilldown-query', 'data'),
+    prevent_initial_call=True
+)
+
+
+@callback(
+    Output('transaction-grid', 'getRowsResponse'),
+    Input('transaction-grid', 'getRowsRequest'),
+    [State('drilldown-query', 'data'),
+     State('transaction-data-store', 'data')]
+)
+def get_transaction_rows(request, query, transactions_data):
+    """
+	Serve one block of the drill-down table.
+	
+	Filtering and sorting run server-side on the cached transactions;
+	only the requested rows are formatted and sent.
+	
+	Parameters
+	----------
+    request: dict
+        AG Grid getRowsRequest (startRow, endRow, sortModel, filterModel)
+    query: dict
+        Drill-down query from update_table
+    transaction_data: dict
+        Handle for the cached transaction data
+	
+	Returns
+	-------
+	dict
+	    Rows for the block and the total row count
+	"""
+    if request is None:
+        raise PreventUpdate
+    if query is None or transactions_data is None:
+        return {"rowData": [], "rowCount": 0}
+
+    uid = session.get("user_id")
+    transactions_data = sync.authorize(store, uid, transactions_data)
+    transactions = sync.resolve_transactions(store, uid, transactions_data)
+    key = (transactions_data["household_id"], transactions_data["version"])
+    return drilldown.get_rows(transactions, key, query, request)
@@ -1,15 +1,16 @@
 import dash
-from dash import html, dcc, callback, Input, Output, State, ctx, Patch
+from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Input, Output, State, ctx, Patch
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_ag_grid as dag
-import json
 import pandas as pd
 import numpy as np
-import os
 import calendar
+from flask import session
 
-from lib.utils import functions
+from firebase import store
+from lib.utils import budgets, functions, settings
+from lib.utils.store import household_path, user_path
 
 dash.register_page(__name__, path='/budget')
 
@@ -63,6 +64,7 @@ layout = html.Div([
             ], className="pt-3 pb-3"),
         html.Div(remaining_to_budget, className="d-grid pb-3"),
         html.Div(grid, style={"height": "65vh", "display": "flex", "flexDirection": "column"}),
+        dcc.Store(id='budget-totals'),
         html.Div(
             [
                 save_budget
@@ -79,14 +81,12 @@ layout = html.Div([
     Output("budget-year", "value")],
     Input("use-case", "value"),
     [State("budget-year", "value"),
-     State('config-store', 'data')]
+     State('config-store', 'data'),
+     State('budget-version', 'data')]
 )
-def initialize_budget_year(user, budget_year, config):
-    config = json.loads(config)
-
-    budget_dict = config["users"][user]['budget']
-
-    budget_years = [year for year, months in budget_dict.items()]
+def initialize_budget_year(user, budget_year, config_version, budget_version):
+    budget_years = settings.budget_years(store, session.get("user_id"),
+                                         budget_version or config_version, user)
 
     options=[
         {'label': str(year), 'value': str(year)}
@@ -102,24 +102,26 @@ def initialize_budget_year(user, budget_year, config):
 @callback(
     [Output("my-grid", "rowData"),
      Output("my-grid", "columnDefs"),
-     Output("my-grid", "getRowStyle")],
+     Output("my-grid", "getRowStyle"),
+     Output("budget-totals", "data")],
     Input("budget-year", "value"),
     State('config-store', 'data'),
+    State('budget-version', 'data'),
     State('use-case', 'value')
 )
-def populate_budget(year, config, user):    
+def populate_budget(year, config_version, budget_version, user):    
     year = int(year)
-    config = json.loads(config)
-    budget = functions.read_budget(config, user)
-    
-    budget = budget.loc[:, (year, 1):(year, 12)]
+    uid = session.get("user_id")
+    version = settings.authorize(store, uid, budget_version or config_version)
+    config = settings.get_config(store, uid, version)
+    budget = settings.budget_matrix(store, uid, version, user).year_frame(year)
 
     budget.columns = [
-        f"{calendar.month_abbr[int(month)]}" 
-        for year, month in budget.columns
+        f"{calendar.month_abbr[month]}" 
+        for month in budget.columns
     ]
 
-    csp_labels = pd.DataFrame.from_dict(config["users"][user]['csp_labels'],
+    csp_labels = pd.DataFrame.from_dict(settings.user_config(store, uid, version, user)['csp_labels'],
                                         orient='index', 
                                         columns=['csp_label'])
 
@@ -135,6 +137,14 @@ def populate_budget(year, config, user):
 
     # Convert DataFrame to rowData for Dash AG Grid
     row_data = budget.to_dict("records")
+
+    # Month totals of income and of everything else, kept up to date
+    # from each edit in the browser
+    income = budget['csp_label'] == 'income'
+    totals = {
+        "income": budget.loc[income, month_columns].sum().to_dict(),
+        "spending": budget.loc[~income, month_columns].sum().to_dict(),
+    }
     
     columnDefs = [
     {"field": "category", "editable": False},
@@ -164,133 +174,124 @@ def populate_budget(year, config, user):
             },
         ]}
 
-    return row_data, columnDefs, getRowStyle
+    return row_data, columnDefs, getRowStyle, totals
 
 
-@callback(
-    Output("my-grid", "dashGridOptions"),
-    [Input("my-grid", "cellValueChanged"),
-    Input("my-grid", "rowData")],
+# Grid totals are updated in the browser from each edit's old and new
+# value (assets/callbacks.js)
+clientside_callback(
+    ClientsideFunction(namespace='budgetbaby', function_name='apply_budget_edits'),
+    Output("budget-totals", "data", allow_duplicate=True),
+    Input("my-grid", "cellValueChanged"),
+    State("budget-totals", "data"),
+    prevent_initial_call=True
 )
-def pin_total_row(cell_value_changed, row_data):
-    df = pd.DataFrame(row_data).set_index("category")
-    month_columns = [col for col in df.columns if col not in ["category", "csp_label", "id"]]
 
-    for col in month_columns:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
 
-    # Calculate total spending
-    filt = df['csp_label'] != 'income'
-    total_row = df.loc[filt, month_columns].sum().to_dict()
-
-    grid_option_patch = Patch()
-    grid_option_patch["pinnedBottomRowData"] = [{"category": "Total", **total_row}]
-    return grid_option_patch
+clientside_callback(
+    ClientsideFunction(namespace='budgetbaby', function_name='pin_total_row'),
+    Output("my-grid", "dashGridOptions"),
+    Input("budget-totals", "data"),
+)
 
 
-@callback(
+clientside_callback(
+    ClientsideFunction(namespace='budgetbaby', function_name='update_total_button'),
     [Output("assign-gf", "children"),
      Output("assign-gf", "color"),
      Output("assign-gf", "disabled")],
-    Input("my-grid", "cellValueChanged"),
-    Input("my-grid", "rowData")
+    Input("budget-totals", "data")
 )
-def update_total_button(cell_value_changed, row_data):
-    df = pd.DataFrame(row_data).set_index('category')
-    month_columns = [col for col in df.columns if col not in ["category", "csp_label", "id"]]
-
-    filt = df['csp_label'] != 'income'
-    total_spend = df.loc[filt, month_columns].sum().sum()
-
-    total_income = df[df['csp_label'] == 'income'][month_columns].sum().sum()
-
-    total_remaining = total_income - total_spend
-
-    disabled=False
-    if total_remaining > 0.12:
-        text = f"${total_remaining:,.2f} Remaining! Click to assign to Guilt-Free spending."
-        color = "primary"
-    elif total_remaining < -0.12:
-        text = f"${-total_remaining:,.2f} Over Budget! Click to subtract from Guilt-Free spending."
-        color="danger"
-    else:
-        text = "Well Done! Every penny has a job."
-        color="light"
-        disabled=True
-
-    return text, color, disabled
 
 
 @callback(
-    Output("my-grid", "rowData", allow_duplicate=True),
+    [Output("my-grid", "rowTransaction"),
+     Output("budget-totals", "data", allow_duplicate=True)],
     Input("assign-gf", "n_clicks"),
-    State("my-grid", "rowData"),
+    [State("my-grid", "rowData"),
+     State("budget-totals", "data")],
     prevent_initial_call=True
 )
-def assign_to_guilt_free(n, row_data):
-    if n is None:
-        return "Not clicked."
-    else:
-        df = pd.DataFrame(row_data).set_index("category")
-        month_columns = [col for col in df.columns if col not in ["category", "csp_label", "id"]]
-        
-        filt = df['csp_label'] != 'income'
-        total_spend = df.loc[filt, month_columns].sum().sum()
-       
-        total_income = df[df['csp_label'] == 'income'][month_columns].sum().sum()
-       
-        total_remaining = total_income - total_spend
-        monthly_remaining = round(total_remaining / 12, 2)
-        
-        df.loc['guilt_free', month_columns] += monthly_remaining
-        
-        updated_row_data = df.reset_index().to_dict("records")
-
-        return updated_row_data
+def assign_to_guilt_free(n, row_data, totals):
+    """
+    Spread the income left to budget over the guilt-free months.
+
+    The remaining amount comes from the running totals; only the
+    guilt-free row is sent back, as a row transaction, along with a
+    patch to the totals.
+    """
+    if n is None or totals is None:
+        raise PreventUpdate
+
+    row = next((row for row in row_data if row["category"] == "guilt_free"), None)
+    if row is None:
+        raise PreventUpdate
+
+    total_remaining = sum(totals["income"].values()) - sum(totals["spending"].values())
+    monthly_remaining = round(total_remaining / 12, 2)
+
+    # Blank months stay blank
+    row = dict(row)
+    bucket = "income" if row["csp_label"] == "income" else "spending"
+    totals_patch = Patch()
+    for month in totals[bucket]:
+        if row.get(month) is not None:
+            row[month] += monthly_remaining
+            totals_patch[bucket][month] = round(totals[bucket][month] + monthly_remaining, 2)
+
+    return {"update": [row], "async": False}, totals_patch
 
 
 @callback(
-    Output('config-store', 'data', allow_duplicate=True),
+    Output('budget-version', 'data'),
     Input("save-budget", "n_clicks"),
     [State("my-grid", "rowData"),
      State('config-store', 'data'),
+     State('budget-version', 'data'),
      State("budget-year", "value"),
      State("use-case", "value")],
     prevent_initial_call=True
 )
-def save_budget(n, row_data, config, budget_year, user):
+def save_budget(n, row_data, config_version, budget_version, budget_year, user):
+    """
+    Save the budget cells changed in the grid.
+
+    The grid is compared with the stored budgets and only changed
+    (month, category) cells are merged into the budget documents. The
+    server-side config is patched under a new version, which is published
+    to ``budget-version`` so only budget-dependent callbacks refresh.
+
+    Returns
+    -------
+    str
+        Version of the patched config.
+    """
     if n is None:
         raise PreventUpdate
-    else:
-        existing_config = json.loads(config)
-        budget = pd.DataFrame(row_data).set_index('category')
-        budget = budget.drop(columns=['csp_label', 'id'], index=CSP_GROUPS)
-
-        month_mapping = {
-            "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
-            "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12
-        }
 
-        budget = budget.reset_index().melt(
-            id_vars="category", var_name="month", value_name="value"
-        ).set_index('category')
+    uid = session.get("user_id")
+    version = settings.authorize(store, uid, budget_version or config_version)
+    matrix = settings.budget_matrix(store, uid, version, user)
 
-        budget['month'] = budget['month'].map(month_mapping)
-        budget['month'] = budget['month'].astype(int)
+    grid = pd.DataFrame(row_data).set_index('category')
+    grid = grid.drop(columns=['csp_label', 'id'], index=CSP_GROUPS)
+    month_mapping = {abbr: month for month, abbr in enumerate(calendar.month_abbr) if abbr}
+    grid.columns = grid.columns.map(month_mapping)
 
-        # Group by year, month, and category
-        grouped = budget.groupby(['month', budget.index])['value'].sum()
-
-        # Convert to nested JSON-like dictionary
-        config = {budget_year: {}}
-
-        for (month, category), value in grouped.items():
-            config[budget_year].setdefault(month, {})[category] = value   
-        
-        existing_config["users"][user]['budget'][budget_year] = config[budget_year]
+    changes = budgets.budget_changes(matrix, int(budget_year), grid)
+    if not changes:
+        raise PreventUpdate
 
-        with open(os.path.join('data', 'config.json'), 'w') as f:
-            json.dump(existing_config, f, indent=4)
+    # Persist changed cells of each month under the user or household
+    owner_uid = settings.user_config(store, uid, version, user)["uid"]
+    if owner_uid == "joint":
+        parent = household_path(functions.find_household_for_user(store, uid))
+    else:
+        parent = user_path(owner_uid)
+    store.update_budgets(parent, changes)
 
-        return json.dumps(existing_config)
+    version = settings.apply_budget_changes(store, uid, version, user, changes)
+    print(f"Saved {sum(len(cells) for cells in changes.values())} budget cells "
+          f"in {len(changes)} months")
 
+    return version
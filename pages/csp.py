@@ -3,7 +3,6 @@ from dash import html, dcc, callback, Input, Output, State, ctx, Patch
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 from datetime import datetime as dt
-import json
 import pandas as pd
 import numpy as np
 import os
@@ -11,8 +10,10 @@ from io import StringIO
 
 import dash_ag_grid as dag
 import calendar
+from flask import session
 
-from lib.utils import functions
+from firebase import store
+from lib.utils import functions, settings
 
 CSP_GROUPS = ['Income', 'Fixed Costs', 'Investments', 'Savings', 'Guilt Free']
 HEADER_ROWS = CSP_GROUPS + ['Total']
@@ -52,23 +53,26 @@ layout = html.Div([
     [Output("csp-grid", "rowData"),
      Output("csp-grid", "columnDefs"),
      Output("csp-grid", "getRowStyle")],
-    Input('config-store', 'data')
+    Input('config-store', 'data'),
+    Input('budget-version', 'data')
 )
-def populate_csp(config):
+def populate_csp(config_version, budget_version):
     year=2025
-    config = json.loads(config)
-    users = list(config["users"].keys())
+    uid = session.get("user_id")
+    version = settings.authorize(store, uid, budget_version or config_version)
+    config = settings.get_config(store, uid, version)
+    users = settings.users(store, uid, version)
 
     user_budgets = []
     for user in users:    
-        budget = config["users"][user]['budget'][str(year)]
-        budget = pd.DataFrame(budget)
+        budget = settings.budget_matrix(store, uid, version, user).year_frame(year)
+        budget = budget.dropna(how='all')
 
         monthly_budget = budget.sum(axis=1).div(12)
         monthly_budget.name = user
         
 
-        csp_labels = pd.DataFrame.from_dict(config["users"][user]['csp_labels'],
+        csp_labels = pd.DataFrame.from_dict(settings.user_config(store, uid, version, user)['csp_labels'],
                                         orient='index', 
                                         columns=['csp_label'])
 
@@ -94,7 +98,7 @@ def populate_csp(config):
     csp['id'] = csp.index
 
     csp['total'] = csp[users].sum(axis=1)
-    csp_labels = pd.DataFrame.from_dict(config["users"][user]['csp_labels'],
+    csp_labels = pd.DataFrame.from_dict(settings.user_config(store, uid, version, user)['csp_labels'],
                                         orient='index', 
                                         columns=['csp_label'])
     csp = pd.merge(csp, csp_labels, left_on='category',
@@ -4,16 +4,16 @@ from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_daq as daq
 from datetime import datetime as dt
+from flask import session
 import json
-import pandas as pd
 import numpy as np
 import os
-from io import StringIO
 
 import dash_ag_grid as dag
 import calendar
 
-from lib.utils import functions
+from firebase import store
+from lib.utils import cache, codec, cube, functions, sync
 
 dash.register_page(__name__, path='/trends')
 
@@ -24,12 +24,28 @@ pct_or_nom = daq.ToggleSwitch(
     value=False
 )
 
+trends_date_picker = dcc.DatePickerRange(
+                id='trends-date-range',
+                start_date='2020-01-01',
+                min_date_allowed='2020-01-01',
+                end_date=dt.today().strftime('%Y-%m-%d'),
+                number_of_months_shown=2,
+                persistence=True,
+                updatemode='bothdates',
+                style={'borderWidth': 0}
+                )
+
 
 layout = html.Div([
     dbc.Container([
             dbc.Row(
                 [
-                    dbc.Col(html.H1('Trends'), width=10),
+                    dbc.Col(html.H1('Trends'), width=6),
+                    dbc.Col(
+                        trends_date_picker,
+                        className='d-flex align-items-end justify-content-end',
+                        width=4
+                    ),
                     dbc.Col(
                         pct_or_nom,
                         className='d-flex align-items-end justify-content-end',
@@ -57,6 +73,55 @@ layout = html.Div([
 ])
 
 
+@callback(
+    Output('transaction-subset-store', 'data'),
+    [Input('transaction-data-store', 'data'),
+     Input('use-case', 'value'),
+     Input('trends-date-range', 'start_date'),
+     Input('trends-date-range', 'end_date')]
+)
+def update_transaction_subset(transactions_data, user, start_date, end_date):
+    """
+    Aggregate the selected window and user for the trends chart.
+
+    Totals are read from the cached monthly cube, so the full history
+    stays server-side and the browser only receives monthly totals by
+    (year, month, owner, csp, csp_label). Encoded windows are cached per
+    (owner, dates, transactions version).
+
+    Parameters
+    ----------
+    transactions_data : dict
+        Handle for the cached transaction data
+    user : str
+        User name from select filter
+    start_date : str
+        Start date from date picker
+    end_date : str
+        End date from date picker
+
+    Returns
+    -------
+    str
+        Aggregates encoded with ``codec.encode_frame``
+    """
+    if not transactions_data or not user:
+        raise PreventUpdate
+
+    # Only serve cached data issued to this user
+    uid = session.get("user_id")
+    transactions_data = sync.authorize(store, uid, transactions_data)
+
+    key = cache.figure_key('trends-subset', transactions_data, user, start_date, end_date)
+    payload = cache.get_figure(key)
+    if payload is None:
+        transactions = sync.resolve_transactions(store, uid, transactions_data)
+        monthly_cube = sync.resolve_cube(store, uid, transactions_data)
+        totals = cube.window_totals(monthly_cube, transactions, start_date, end_date, owner=user)
+        payload = cache.put_figure(key, codec.encode_frame(totals))
+    return payload
+
+
 @callback(
     Output('csp-chart', 'figure'),
     [Input('transaction-subset-store', 'data'),
@@ -64,15 +129,20 @@ layout = html.Div([
      Input('csp-chart', 'clickData')],
      State('csp-chart', 'figure')
 )
-def update_csp_chart(transactions_data, as_percent, clickData, fig):
-    transactions = pd.read_json(StringIO(transactions_data), orient='split')
-    if clickData is None:
-        fig = functions.plot_csp_by_label(transactions, as_percent)
-    else:  #TODO: make a second chart (detail that is expanded on click)
+def update_csp_chart(aggregates_data, as_percent, clickData, fig):
+    if not aggregates_data:
+        raise PreventUpdate
+    if clickData is not None:  #TODO: make a second chart (detail that is expanded on click)
         click = clickData['points'][0]["curveNumber"]
         csp_label_name = fig["data"][click]["name"]
         print(csp_label_name)
-        fig = functions.plot_csp_by_label(transactions, as_percent)
+
+    # Keyed by the aggregates themselves, so an entry can never be stale
+    key = ('csp-chart', codec.payload_digest(aggregates_data), as_percent)
+    fig = cache.get_figure(key)
+    if fig is None:
+        aggregates = codec.decode_frame(aggregates_data)
+        fig = cache.put_figure(key, functions.plot_csp_by_label(aggregates, as_percent))
     return fig
 
 
@@ -0,0 +1,70 @@
+"""
+Compare dcc.Store payload formats for the Trends aggregates.
+
+Builds the ``cube.window_totals`` frame held in
+``transaction-subset-store`` for five years of synthetic transactions
+over a growing number of categories. Times the previous ISO JSON round
+trip (``to_json(orient="split")`` and ``pd.read_json``) against
+``codec.encode_frame``/``codec.decode_frame`` and reports payload size.
+Binary decodes are timed cold and again as memo hits.
+
+    python scripts/benchmark_codec.py --categories 10 100 1000
+"""
+import argparse
+import os
+import sys
+from io import StringIO
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.utils import codec, cube
+from scripts.synthetic import best_of, category_labels, synthetic_transactions
+
+# Transactions per category, enough to fill most monthly cells
+TRANSACTIONS_PER_CATEGORY = 100
+
+
+def synthetic_totals(categories, seed=0):
+    """Five-year ``window_totals`` aggregates for ``categories`` categories."""
+    transactions = synthetic_transactions(categories * TRANSACTIONS_PER_CATEGORY,
+                                          category_labels(categories), seed=seed)
+    transactions["account_owner"] = "bench"
+    transactions = transactions.sort_values("date", ignore_index=True)
+    return cube.window_totals(cube.build_cube(transactions), transactions,
+                              transactions["date"].min(), transactions["date"].max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--categories", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'format':<7} {'size':>10} {'encode':>10} {'decode':>10} {'memo hit':>10}")
+    for categories in args.categories:
+        df = synthetic_totals(categories)
+        rows = len(df)
+        formats = {
+            "json": (
+                lambda: df.to_json(date_format="iso", orient="split"),
+                lambda payload: pd.read_json(StringIO(payload), orient="split"),
+            ),
+            "binary": (
+                lambda: codec.encode_frame(df),
+                lambda payload: (codec.clear_decode_cache(), codec.decode_frame(payload)),
+            ),
+        }
+        for name, (encode, decode) in formats.items():
+            encode_seconds, payload = best_of(encode, args.repeat)
+            decode_seconds, _ = best_of(lambda: decode(payload), args.repeat)
+            line = (f"{rows:>10,} {name:<7} {len(payload) / 1e6:>8.2f}MB "
+                    f"{encode_seconds * 1000:>8.1f}ms {decode_seconds * 1000:>8.1f}ms")
+            if name == "binary":
+                hit_seconds, _ = best_of(lambda: codec.decode_frame(payload), args.repeat)
+                line += f" {hit_seconds * 1000:>8.1f}ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
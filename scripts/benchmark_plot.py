@@ -0,0 +1,69 @@
+"""
+Time the budget chart build for growing category maps.
+
+Builds a synthetic budget report with the requested number of
+categories spread across the CSP groups, then times
+``functions.plot_report`` (full figure) and ``functions.patch_report``
+(in-place update) and reports the JSON size of each.
+
+    python scripts/benchmark_plot.py --categories 20 200 2000
+"""
+import argparse
+import os
+import sys
+from datetime import datetime as dt
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.utils import budgets, functions
+from scripts.synthetic import GROUP_LABELS, best_of, category_labels, synthetic_transactions
+
+USER = "bench"
+
+
+def synthetic_report(categories, seed=0):
+    """Budget report with ``categories`` categories and a year of spending."""
+    rng = np.random.default_rng(seed)
+    csp_labels = category_labels(categories)
+    names = list(csp_labels)
+
+    transactions = synthetic_transactions(categories * 50, csp_labels, start="2025-01-01",
+                                          days=365, seed=seed)
+    transactions["account_owner"] = USER
+    transactions = transactions.sort_values("date", ignore_index=True)
+
+    amounts = rng.gamma(2, 1000, size=(categories, 12)).round(0)
+    budget = budgets.BudgetMatrix.from_config({"2025": {
+        str(month): dict(zip(names, amounts[:, month - 1])) for month in range(1, 13)
+    }})
+
+    # Each group heading followed by its categories
+    cat_order = []
+    for group, label in GROUP_LABELS.items():
+        cat_order += [group] + [name for name in names if csp_labels[name] == label]
+    config = {"users": {USER: {"cat_order": cat_order}}}
+
+    return functions.build_budget_report(
+        transactions, budget, dt(2025, 1, 1), dt(2025, 12, 31), config, USER)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--categories", type=int, nargs="+", default=[20, 200, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    start, end = dt(2025, 1, 1), dt(2025, 12, 31)
+    print(f"{'categories':>10} {'build':>10} {'size':>10} {'patch':>10} {'size':>10}")
+    for categories in args.categories:
+        report = synthetic_report(categories)
+        build_seconds, fig = best_of(lambda: functions.plot_report(report, start, end), args.repeat)
+        patch_seconds, patch = best_of(lambda: functions.patch_report(report, start, end), args.repeat)
+        print(f"{categories:>10,} {build_seconds * 1000:>8.1f}ms {len(to_json_plotly(fig)) / 1e3:>8.1f}KB "
+              f"{patch_seconds * 1000:>8.1f}ms {len(to_json_plotly(patch)) / 1e3:>8.1f}KB")
+
+
+if __name__ == "__main__":
+    main()
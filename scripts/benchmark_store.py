@@ -0,0 +1,107 @@
+"""
+Compare transaction store latency.
+
+Seeds a synthetic household into a local SQLite store (once per file) and
+times the reads the app makes: a cold sync, a warm incremental sync and a
+one-month date-range query, plus a batch of writes. Pass ``--backend
+firestore --uid <uid>`` to time the same reads against Firestore; writes
+are skipped there so production data is never touched.
+
+    python scripts/benchmark_store.py --rows 1000000
+    python scripts/benchmark_store.py --backend sqlite firestore --uid <uid>
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.utils import functions, sync
+from lib.utils.store import household_path, open_store, user_path
+from scripts.synthetic import synthetic_transactions
+
+BENCH_UID = "bench-user"
+BENCH_HOUSEHOLD = "bench-household"
+
+
+def seed(store, rows):
+    """Create the benchmark user and household and write their transactions."""
+    if store.get_document(user_path(BENCH_UID)) is not None:
+        return
+    print(f"Seeding {rows:,} transactions...")
+    store.update_document(user_path(BENCH_UID), {"name": "bench", "accounts": ["Bench Checking"]})
+    store.update_document(household_path(BENCH_HOUSEHOLD), {"members": [BENCH_UID], "accounts": []})
+
+    df = synthetic_transactions(rows)
+    df["content_hash"] = functions.content_hash(df)
+    half = rows // 2
+    stats = store.write_transactions(
+        [(user_path(BENCH_UID), txn) for txn in df.iloc[:half].to_dict(orient="records")]
+        + [(household_path(BENCH_HOUSEHOLD), txn) for txn in df.iloc[half:].to_dict(orient="records")]
+    )
+    print(f"Seeded in {stats['seconds']:.1f}s ({stats['docs_per_sec']:,.0f} docs/sec)")
+
+
+def timed(label, fn, results):
+    start = time.perf_counter()
+    value = fn()
+    results[label] = time.perf_counter() - start
+    return value
+
+
+def run(kind, uid, rows, writes):
+    store = open_store(kind, db=firestore_client() if kind == "firestore" else None)
+    if kind == "sqlite":
+        seed(store, rows)
+
+    results = {}
+    sync.invalidate()
+    handle = timed("cold sync", lambda: sync.load_transactions(store, uid), results)
+    timed("warm sync", lambda: sync.load_transactions(store, uid), results)
+    frame = sync.resolve_transactions(store, uid, handle)
+
+    end = frame["date"].max()
+    start = end - pd.DateOffset(months=1)
+    month = timed("month query", lambda: store.read_transactions(
+        user_path(uid), sync.SYNC_FIELDS, start=start, end=end), results)
+
+    if kind == "sqlite" and writes:
+        changed = frame.loc[frame["account_owner"] != "joint"].head(writes).copy()
+        changed["amount"] += 1
+        changed = changed.drop(columns=["account_owner"])
+        timed(f"write {len(changed):,}", lambda: store.write_transactions(
+            [(user_path(uid), txn) for txn in changed.to_dict(orient="records")]), results)
+        timed("sync after write", lambda: sync.load_transactions(store, uid), results)
+
+    print(f"\n{kind}: {len(frame):,} transactions, {len(month):,} in the last month")
+    for label, seconds in results.items():
+        print(f"  {label:<20} {seconds * 1000:>10,.1f} ms")
+
+
+def firestore_client():
+    from firebase import db
+    if db is None:
+        # TRANSACTION_STORE selects SQLite for the app; benchmark Firestore anyway
+        from firebase_admin import firestore
+        db = firestore.client()
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", nargs="+", default=["sqlite"], choices=["sqlite", "firestore"])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="transactions to seed into SQLite")
+    parser.add_argument("--writes", type=int, default=1000, help="transactions to rewrite (SQLite only)")
+    parser.add_argument("--uid", help="user to read from Firestore")
+    args = parser.parse_args()
+
+    for kind in args.backend:
+        if kind == "firestore" and not args.uid:
+            parser.error("--uid is required for the firestore backend")
+        run(kind, args.uid if kind == "firestore" else BENCH_UID, args.rows, args.writes)
+
+
+if __name__ == "__main__":
+    main()
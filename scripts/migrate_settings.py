@@ -1,7 +1,12 @@
+import os
+import sys
 import firebase_admin
 from firebase_admin import credentials, auth, firestore
 import json
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.utils.store import household_path, open_store, user_path
+
 # Initialize Firebase Admin SDK
 if not firebase_admin._apps:
     cred = credentials.Certificate("firebase-service-account.json")
@@ -9,6 +14,7 @@ if not firebase_admin._apps:
 
 # Firestore client
 db = firestore.client()
+store = open_store(db=db)
 
 # Load JSON config file
 with open("data/config.json", "r") as f:
@@ -33,15 +39,14 @@ for name, email in user_email_map.items():
         print(f"Error fetching user for {email}: {e}")
 
 # Create household if both users are found
-household_ref = None
+household_id = None
 if len(user_ids) == len(user_email_map):
     household_data = {
         "name": "The Andersons",
         "members": user_ids
     }
-    household_ref = db.collection("households").document()
-    household_ref.set(household_data)
-    print(f"Created household '{household_data['name']}' with ID: {household_ref.id}")
+    household_id = store.add_document("households", household_data)
+    print(f"Created household '{household_data['name']}' with ID: {household_id}")
 else:
     raise ValueError("Household not created; one or more users not found.")
 
@@ -54,36 +59,37 @@ account_owner = config_data.get("account_owner", {})
 users_data = config_data.get("users", {})
 for user_key, user_data in users_data.items():
     if user_key == "joint":
-        base_ref = household_ref
+        base_path = household_path(household_id)
         accounts = [acct for acct, owner in account_owner.items() if owner == user_key]
-        base_ref.set({"accounts": accounts}, merge=True)
+        store.update_document(base_path, {"accounts": accounts})
     
     else:
         uid = email_uid_map.get(user_email_map.get(user_key))
         if not uid:
             print(f"Skipping user '{user_key}' - no matching UID found.")
             continue
-        base_ref = db.collection("users").document(uid)
+        base_path = user_path(uid)
 
         # Add accounts from account_owner
         accounts = [acct for acct, owner in account_owner.items() if owner == user_key]
-        base_ref.set({"accounts": accounts}, merge=True)
+        store.update_document(base_path, {"accounts": accounts})
 
         # Save name
-        base_ref.set({"name": user_key}, merge=True)
+        store.update_document(base_path, {"name": user_key})
 
     # Store budgets
     budget = user_data.get("budget", {})
-    for year, months in budget.items():
-        for month, categories in months.items():
-            doc_id = f"{year}-{str(month).zfill(2)}"
-            base_ref.collection("budgets").document(doc_id).set(categories)
+    store.write_budgets(base_path, {
+        f"{year}-{str(month).zfill(2)}": categories
+        for year, months in budget.items()
+        for month, categories in months.items()
+    })
 
     # Store config values
     config_fields = ["drop_cats", "csp_from_group", "csp_from_category", "csp_labels", "cat_order"]
     config_payload = {k: v for k, v in user_data.items() if k in config_fields}
     config_payload["group_names"] = group_names
     config_payload["cat_names"] = cat_names
-    base_ref.set(config_payload, merge=True)
+    store.update_document(base_path, config_payload)
 
 print("Migration complete.")
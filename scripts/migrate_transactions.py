@@ -1,14 +1,20 @@
 import os
+import sys
 import pandas as pd
 import firebase_admin
 from firebase_admin import credentials, auth, firestore
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.utils import functions, writer
+from lib.utils.store import household_path, open_store, user_path
+
 # Firebase setup
 if not firebase_admin._apps:
     cred = credentials.Certificate("firebase-service-account.json")
     firebase_admin.initialize_app(cred)
 
 db = firestore.client()
+store = open_store(db=db)
 
 # Local transaction file
 FILE_NAME = "raw-transactions.pkl"
@@ -22,46 +28,8 @@ email_to_user = {
 def read_transactions(file_name=FILE_NAME):
     return pd.read_pickle(os.path.join("data", file_name))
 
-def process_transactions(df, config):
-    category_names = config["cat_names"]
-    csp_from_group = config["csp_from_group"]
-    csp_from_category = config["csp_from_category"]
-    csp_labels = config["csp_labels"]
-    drop_cats = config["drop_cats"]
-    
-    # Assign labels
-    df["category_group"] = df["category_name"].map(category_names)
-    df = df.assign(
-        csp_from_group=df["category_group"].map(csp_from_group),
-        csp_from_category=df["category_name"].map(csp_from_category),
-        csp=lambda x: x["csp_from_group"].fillna(x["csp_from_category"]).fillna("guilt_free"),
-        csp_label=lambda x: x["csp"].map(csp_labels)
-    )
-
-    # Drop transactions
-    df = df.loc[~df["category_name"].isin(drop_cats) & ~df["hideFromReports"]]
-
-    return df
-
-
-def find_household_for_user(uid):
-    households_ref = db.collection("households")
-    query = households_ref.where("members", "array_contains", uid).limit(1)
-    docs = query.stream()
-    
-    for doc in docs:
-        return doc.id  # first (and only) match
-    
-    return None
-
-
-
 def main():
-    transactions_df = read_transactions()
-    transactions_df["category_name"] = transactions_df["category"].apply(lambda x: x["name"])
-    transactions_df["account_name"] = transactions_df["account"].apply(lambda x: x["displayName"])
-
-    users_ref = db.collection("users")
+    transactions_df = functions.normalize_transactions(read_transactions())
 
     for email, user_key in email_to_user.items():
         try:
@@ -70,14 +38,12 @@ def main():
             print(f"Skipping {email} - no UID found.")
             continue
 
-        user_doc = users_ref.document(uid).get()
-        if not user_doc.exists:
+        config = store.get_document(user_path(uid))
+        if config is None:
             print(f"User document for {email} not found.")
             continue
 
-        config = user_doc.to_dict()
-
-        household_id = find_household_for_user(uid)
+        household_id = functions.find_household_for_user(store, uid)
         if not household_id:
             print(f"No household found for user {user_key} ({email})")
             continue
@@ -86,36 +52,30 @@ def main():
         filt = transactions_df['account_name'].isin(config['accounts'])
         user_txns = transactions_df.loc[filt].copy()
 
-        user_txns = process_transactions(user_txns, config)
-        user_txns_dict = user_txns.drop(columns=["category", "account", "merchant"]).to_dict(orient="records")
+        user_txns = functions.process_transactions(user_txns, config)
+        user_txns["content_hash"] = functions.content_hash(user_txns)
+        user_txns_dict = user_txns.to_dict(orient="records")
 
         print(f"Uploading {len(user_txns_dict)} transactions for {user_key}...")
-        batch = db.batch()
-        for txn in user_txns_dict:
-            txn_id = txn["id"]
-            doc_ref = db.collection("users").document(uid).collection("transactions").document(str(txn_id))
-            batch.set(doc_ref, txn)
-        batch.commit()
+        store.write_transactions([
+            (user_path(uid), txn) for txn in user_txns_dict
+        ], progress=writer.print_progress)
         print(f"Done uploading for {user_key}.")
 
     # Process and upload transactions for joint household
-    household_ref = db.collection("households")
-    household_doc = household_ref.document(household_id).get()
-    config = household_doc.to_dict()
+    config = store.get_document(household_path(household_id))
 
     filt = transactions_df['account_name'].isin(config['accounts'])
     hh_txns = transactions_df.loc[filt].copy()
 
-    hh_txns = process_transactions(hh_txns, config)
-    hh_txns_dict = hh_txns.drop(columns=["category", "account", "merchant"]).to_dict(orient="records")
+    hh_txns = functions.process_transactions(hh_txns, config)
+    hh_txns["content_hash"] = functions.content_hash(hh_txns)
+    hh_txns_dict = hh_txns.to_dict(orient="records")
 
     print(f"Uploading {len(hh_txns_dict)} transactions for {household_id}...")
-    batch = db.batch()
-    for txn in hh_txns_dict:
-        txn_id = txn["id"]
-        doc_ref = db.collection("households").document(household_id).collection("transactions").document(str(txn_id))
-        batch.set(doc_ref, txn)
-    batch.commit()
+    store.write_transactions([
+        (household_path(household_id), txn) for txn in hh_txns_dict
+    ], progress=writer.print_progress)
     print(f"Done uploading for {household_id}.")
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+"""
+Synthetic data shared by the benchmark scripts.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+# CSP label for each synthetic category
+CSP_LABELS = {
+    "rent": "fixed_costs", "groceries": "fixed_costs", "dining": "guilt_free",
+    "travel": "guilt_free", "brokerage": "investments", "salary": "income",
+}
+
+# CSP label for each group heading in the budget chart
+GROUP_LABELS = {
+    "Income": "income", "Fixed Costs": "fixed_costs", "Investments": "investments",
+    "Savings": "savings", "Guilt Free": "guilt_free",
+}
+
+
+def category_labels(categories):
+    """``categories`` synthetic categories spread evenly across the CSP groups."""
+    labels = np.array(list(GROUP_LABELS.values()))[np.arange(categories) % len(GROUP_LABELS)]
+    return {f"{label}_{i}": label for i, label in enumerate(labels)}
+
+
+def synthetic_transactions(rows, csp_labels=CSP_LABELS, start="2021-01-01", days=5 * 365, seed=0):
+    """
+    Processed transactions with categories drawn uniformly from ``csp_labels``.
+
+    Parameters
+    ----------
+    rows : int
+        Number of transactions.
+    csp_labels : dict, optional
+        CSP label for each category.
+    start : str, optional
+        First day of the range the dates are drawn from.
+    days : int, optional
+        Length of that range.
+    seed : int, optional
+        Random seed.
+
+    Returns
+    -------
+    pd.DataFrame
+        Transactions in ``sync.TRANSACTION_FIELDS`` plus ``id``, unsorted.
+    """
+    rng = np.random.default_rng(seed)
+    category = np.array(list(csp_labels))[rng.integers(len(csp_labels), size=rows)]
+    return pd.DataFrame({
+        "id": [f"bench-{i}" for i in range(rows)],
+        "date": pd.Timestamp(start, tz="UTC")
+                + pd.to_timedelta(rng.integers(days, size=rows), unit="D"),
+        "amount": rng.normal(-50, 80, size=rows).round(2),
+        "csp": category,
+        "csp_label": pd.Series(category).map(csp_labels).values,
+        "category_name": category,
+        "account_name": "Bench Checking",
+        "plaidName": "BENCH MERCHANT",
+        "notes": None,
+    })
+
+
+def best_of(fn, repeat):
+    """Fastest of ``repeat`` calls in seconds, and the last result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result